@@ -0,0 +1,209 @@
+import heapq
+
+INF = float("inf")
+
+def eccentricities(graph, samples=None):
+    """
+    computes the eccentricity of every node: the greatest distance from it
+    to any node it can reach. nodes it cannot reach are ignored
+    :param graph: the Graph to analyse
+    :param samples: if given, only this many searches are run, and each
+        eccentricity is a lower bound rather than exact
+    :return: a dictionary from each node id to its eccentricity
+    """
+    return _bounds(graph, "all", samples)[0]
+
+def diameter(graph, samples=None):
+    """
+    :return: the greatest distance between any node and a node it can reach
+    :param samples: if given, only this many searches are run, and the
+        result is a lower bound rather than exact
+    """
+    lower = _bounds(graph, "diameter", samples)[0]
+    return max(lower.values()) if len(lower) > 0 else 0
+
+def radius(graph, samples=None):
+    """
+    :return: a tuple of the radius of the graph, the smallest eccentricity
+        among the nodes that reach the most nodes, and a list of the ids of
+        the nodes with that eccentricity, its center
+    :param samples: if given, only this many searches are run, and the
+        result is an estimate rather than exact
+    """
+    lower, upper, reach = _bounds(graph, "radius", samples)
+    if len(reach) == 0:
+        return (0, [])
+    most = max(reach.values())
+    value = min([upper[nid] for nid in upper if reach[nid] == most])
+    center = [nid for nid in graph.node_ids() if reach[nid] == most and lower[nid] >= value and upper[nid] <= value]
+    if len(center) == 0:
+        # some bounds were left loose by sampling
+        center = [nid for nid in graph.node_ids() if reach[nid] == most and upper[nid] == value]
+    return (value, center)
+
+def _bounds(graph, goal, samples):
+    """
+    computes lower and upper bounds on the eccentricity of every node. the
+    bounds are exact for every node that the goal depends on
+    :param goal: "all", "diameter" or "radius"
+    :return: a tuple of dictionaries from node ids to the lower bounds, the
+        upper bounds, and the number of nodes each can reach
+    """
+    if _is_symmetric(graph):
+        return _bounding_eccentricities(graph, goal, samples)
+
+    # without symmetric distances no bounds carry over between nodes, so
+    # search from every node, or from the sampled nodes only
+    nids = graph.node_ids()
+    if samples != None and samples < len(nids):
+        sources = _spread_sources(graph, samples)
+    else:
+        sources = nids
+    lower = dict.fromkeys(nids, 0)
+    upper = dict.fromkeys(nids, INF)
+    reach = dict.fromkeys(nids, 1)
+    for source in sources:
+        dists = _distances(graph, source, False)
+        lower[source] = upper[source] = max(dists.values())
+        reach[source] = len(dists)
+        if sources is not nids:
+            # when sampling, a reverse search bounds every node's
+            # eccentricity from below
+            for nid, distance in _distances(graph, source, True).items():
+                lower[nid] = max(lower[nid], distance)
+    return (lower, upper, reach)
+
+def _bounding_eccentricities(graph, goal, samples):
+    """
+    the bounding diameters algorithm of Takes and Kosters, for graphs whose
+    distances are symmetric. a search from w gives every node v in the same
+    component max(d(v, w), ecc(w) - d(v, w)) <= ecc(v) <= ecc(w) + d(v, w),
+    and nodes drop out once their bounds meet or cannot matter to the goal
+    """
+    lower = dict()
+    upper = dict()
+    reach = dict()
+    searches = 0
+    for component in _components(graph):
+        for nid in component:
+            lower[nid] = 0
+            upper[nid] = INF
+            reach[nid] = len(component)
+
+        candidates = set(component)
+        best_lower = 0
+        best_upper = INF
+        pick_high = True
+        while len(candidates) > 0:
+            if samples != None and searches >= samples:
+                break
+
+            # alternate between the most and least eccentric looking nodes.
+            # the diameter only needs the most eccentric, which makes the
+            # first two searches a double sweep
+            if pick_high or goal == "diameter":
+                source = max(candidates, key=lambda nid: (upper[nid], graph.out_deg(nid)))
+            else:
+                source = min(candidates, key=lambda nid: (lower[nid], -graph.out_deg(nid)))
+            pick_high = not pick_high
+
+            dists = _distances(graph, source, False)
+            searches += 1
+            ecc = max(dists.values())
+            lower[source] = upper[source] = ecc
+            candidates.discard(source)
+            best_lower = max(best_lower, ecc)
+            best_upper = min(best_upper, ecc)
+
+            for nid in list(candidates):
+                distance = dists[nid]
+                lower[nid] = max(lower[nid], distance, ecc - distance)
+                upper[nid] = min(upper[nid], ecc + distance)
+                if lower[nid] == upper[nid]:
+                    candidates.discard(nid)
+                elif goal == "diameter" and upper[nid] <= best_lower:
+                    candidates.discard(nid)
+                elif goal == "radius" and lower[nid] > best_upper:
+                    candidates.discard(nid)
+
+            if goal == "diameter":
+                best_lower = max([best_lower] + [lower[nid] for nid in candidates])
+                candidates = set([nid for nid in candidates if upper[nid] > best_lower])
+
+    return (lower, upper, reach)
+
+def _is_symmetric(graph):
+    """
+    :return: whether every edge of the graph has an equal edge back
+    """
+    if graph.undirected:
+        return True
+    for nid in graph.node_ids():
+        for child in graph.child_ids(nid):
+            if graph.edge(child, nid) != graph.edge(nid, child):
+                return False
+    return True
+
+def _components(graph):
+    """
+    :return: a list of the connected components of a symmetric graph,
+        each a list of node ids
+    """
+    components = []
+    seen = set()
+    for start in graph.node_ids():
+        if start in seen:
+            continue
+        seen.add(start)
+        component = [start]
+        stack = [start]
+        while len(stack) > 0:
+            for child in graph.child_ids(stack.pop()):
+                if child not in seen:
+                    seen.add(child)
+                    component.append(child)
+                    stack.append(child)
+        components.append(component)
+    return components
+
+def _spread_sources(graph, samples):
+    """
+    :return: a list of samples node ids spread across the graph, each the
+        farthest node from the ones already chosen
+    """
+    nids = graph.node_ids()
+    sources = [max(nids, key=graph.out_deg)]
+    nearest = _distances(graph, sources[0], False)
+    while len(sources) < samples:
+        remaining = [nid for nid in nids if nid not in sources]
+        # unreached nodes count as the farthest of all
+        source = max(remaining, key=lambda nid: nearest.get(nid, INF))
+        sources.append(source)
+        for nid, distance in _distances(graph, source, False).items():
+            nearest[nid] = min(nearest.get(nid, INF), distance)
+    return sources
+
+def _distances(graph, source, reverse):
+    """
+    runs Dijkstra's algorithm from source, along edges or against them
+    :return: a dictionary from each reached node id to its distance
+    """
+    dists = dict()
+    heap = [(0, source)]
+    pushes = 1
+    pops = relaxed = 0
+    while len(heap) > 0:
+        distance, node = heapq.heappop(heap)
+        pops += 1
+        if node in dists:
+            continue
+        dists[node] = distance
+        neighbours = graph.parent_ids(node) if reverse else graph.child_ids(node)
+        relaxed += len(neighbours)
+        for other in neighbours:
+            if other not in dists:
+                length = graph.edge(other, node) if reverse else graph.edge(node, other)
+                heapq.heappush(heap, (distance + length, other))
+                pushes += 1
+    graph.count_search(len(dists), relaxed, pushes, pops)
+    return dists
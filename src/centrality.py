@@ -0,0 +1,125 @@
+import heapq
+import random
+
+# the adjacency of the graph being analysed, set in each worker process
+_adjacency = None
+
+def betweenness(graph, samples=None, processes=None, seed=None):
+    """
+    computes the betweenness centrality of every node with Brandes'
+    algorithm, using edge lengths as distances. a node's score is the
+    number of shortest paths between ordered pairs of other nodes that
+    pass through it, with ties split evenly
+    :param graph: the Graph to analyse
+    :param samples: if given, the number of randomly chosen source nodes
+        from which to estimate the scores, rather than using every node
+    :param processes: the number of processes to spread the sources over,
+        by default one per core
+    :param seed: the seed for choosing sampled sources
+    :return: a dictionary from each node id to its score
+    """
+    adjacency = dict()
+    for nid in graph.node_ids():
+        adjacency[nid] = [(child, graph.edge(nid, child)) for child in graph.child_ids(nid)]
+
+    sources = list(adjacency)
+    scale = 1.0
+    if samples != None and samples < len(sources):
+        sources = random.Random(seed).sample(sources, samples)
+        scale = float(len(adjacency)) / samples
+
+    # imported here, as it is slow to import and rarely needed
+    import multiprocessing
+    processes = min(processes or multiprocessing.cpu_count(), len(sources))
+    if processes > 1:
+        # every worker gets the adjacency once, and a share of the sources
+        chunks = [sources[i::processes * 4] for i in range(processes * 4)]
+        pool = multiprocessing.Pool(processes, _init_worker, (adjacency,))
+        try:
+            partials = pool.map(_brandes_sources, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(adjacency)
+        partials = [_brandes_sources(sources)]
+
+    scores = dict.fromkeys(adjacency, 0.0)
+    work = [0, 0, 0, 0]
+    for partial, partial_work in partials:
+        for nid in partial:
+            scores[nid] += partial[nid]
+        work = [total + amount for total, amount in zip(work, partial_work)]
+    graph.count_search(*work)
+    if scale != 1.0:
+        for nid in scores:
+            scores[nid] *= scale
+    return scores
+
+def _init_worker(adjacency):
+    global _adjacency
+    _adjacency = adjacency
+
+def _brandes_sources(sources):
+    """
+    :return: a tuple of a dictionary from node ids to the dependencies
+        accumulated from the given sources, for the adjacency set by
+        _init_worker, and a list of the numbers of nodes settled, edges
+        relaxed, and heap pushes and pops done to find them
+    """
+    scores = dict()
+    work = [0, 0, 0, 0]
+    for source in sources:
+        for nid, dependency in _brandes_source(_adjacency, source, work):
+            scores[nid] = scores.get(nid, 0.0) + dependency
+    return (scores, work)
+
+def _brandes_source(adjacency, source, work):
+    """
+    runs a single source iteration of Brandes' algorithm
+    :param work: a list of the numbers of nodes settled, edges relaxed,
+        and heap pushes and pops so far, to which this search's are added
+    :return: a list of (node id, dependency of source on it) pairs
+    """
+    # dists and sigma hold the distance to, and number of shortest paths
+    # to, each reached node; preds holds the node's parents on those paths
+    dists = {source: 0}
+    sigma = {source: 1}
+    preds = {source: []}
+    order = []
+    settled = set()
+    heap = [(0, source)]
+    pushes = 1
+    pops = relaxed = 0
+    while len(heap) > 0:
+        distance, node = heapq.heappop(heap)
+        pops += 1
+        if node in settled:
+            continue
+        settled.add(node)
+        order.append(node)
+        relaxed += len(adjacency[node])
+        for child, length in adjacency[node]:
+            new_dist = distance + length
+            old_dist = dists.get(child)
+            if old_dist == None or new_dist < old_dist:
+                dists[child] = new_dist
+                sigma[child] = sigma[node]
+                preds[child] = [node]
+                heapq.heappush(heap, (new_dist, child))
+                pushes += 1
+            elif new_dist == old_dist and child not in settled:
+                sigma[child] += sigma[node]
+                preds[child].append(node)
+
+    work[0] += len(order)
+    work[1] += relaxed
+    work[2] += pushes
+    work[3] += pops
+
+    # accumulate dependencies from the farthest nodes back
+    delta = dict.fromkeys(order, 0.0)
+    for node in reversed(order):
+        for pred in preds[node]:
+            delta[pred] += float(sigma[pred]) / sigma[node] * (1 + delta[node])
+    return [(node, delta[node]) for node in order if node != source]
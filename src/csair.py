@@ -1,7 +1,5 @@
 from csair_map import Map
 from os import path
-import webbrowser
-import graph_parser
 import sys
 
 ROOT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
@@ -18,7 +16,13 @@ HELP_MESSAGE =  "h                           : prints this message\n" + \
                 "smallest_city               : displays the smallest city by population\n" + \
                 "average_population          : displays the average city population\n" + \
                 "list_continents             : lists all available continents with their available cities\n" + \
-                "hubs [NUM]                  : lists NUM biggest hub cities\n" + \
+                "hubs [NUM] [--by betweenness] [--sample K]\n" + \
+                "                            : lists NUM biggest hub cities, by direct connections or by\n" + \
+                "                              shortest routes through them, estimated from K cities if given\n" + \
+                "diameter [--sample K]       : displays the longest shortest route, estimated from K searches if given\n" + \
+                "radius [--sample K]         : displays the network radius and its center cities\n" + \
+                "eccentricity <CODE> [--sample K]\n" + \
+                "                            : displays the longest shortest route from the city with code CODE\n" + \
                 "visualize                   : opens a map visualizer in browser\n" + \
                 "add_city <CODE> <JSON_DATA> : adds a city to the map\n" + \
                 "remove_city <CITY>          : removes city with code CODE from the map\n" + \
@@ -27,8 +31,18 @@ HELP_MESSAGE =  "h                           : prints this message\n" + \
                 "remove_route <SRC> <DST>    : removes the flight between SRC and DST\n" + \
                 "route_info <CITIES...>      : displays info regarding the route represented by the list CITIES\n" + \
                 "shortest_path <SRC> <DST>   : displays the shortest route between SRC and DST\n" + \
-                "load <FILE>                 : loads the json data in FILE into the map\n" + \
-                "save [FILE]                 : saves the map in json form to FILE, if provided, or to saved state if not\n" + \
+                "distances <SRCS> <DSTS>     : displays the distances between comma separated lists of cities\n" + \
+                "k_shortest_paths <S> <D> [K]: displays the K shortest routes between S and D\n" + \
+                "fastest_path <SRC> <DST>    : displays the fastest route between SRC and DST\n" + \
+                "cheapest_path <SRC> <DST>   : displays the cheapest route between SRC and DST\n" + \
+                "route_options <SRC> <DST>   : displays every best trade-off of time, cost and flights between SRC and DST\n" + \
+                "track <CITIES...>           : keeps shortest paths from the cities in CITIES up to date\n" + \
+                "cache_stats                 : displays usage of the query result cache\n" + \
+                "profile [COMMAND...]        : runs COMMAND and displays the work the graph algorithms did,\n" + \
+                "                              or displays the memory taken by the map if no command is given\n" + \
+                "load <FILES...>             : loads the json data in FILES, or in the json files of directories, into the map\n" + \
+                "save [FILE] [--compact]     : saves the map in json form to FILE, if provided, or to saved state if not\n" + \
+                "export <FILE> [FORMAT]      : writes every route to FILE as csv, geojson or gcmap urls (csv by default)\n" + \
                 "exit                        : exits the CLI"
 
 def get_command():
@@ -75,15 +89,64 @@ def execute(cmd, airmap):
         print "Continents:\n"
         print airmap.continent_list()
     elif cmds[0] == "hubs":
-        if len(cmds) > 1:
-            hubs = airmap.hubs(int(cmds[1]))
+        args = cmds[1:]
+        by = "connections"
+        samples = None
+        if "--by" in args and args.index("--by") + 1 < len(args):
+            by = args.pop(args.index("--by") + 1)
+            args.remove("--by")
+        if "--sample" in args and args.index("--sample") + 1 < len(args):
+            samples = args.pop(args.index("--sample") + 1)
+            args.remove("--sample")
+        if len(args) > 0:
+            hubs = airmap.hubs(args[0], by, samples)
+        else:
+            hubs = airmap.hubs(by=by, samples=samples)
+        if isinstance(hubs, basestring):
+            print hubs
+        else:
+            if by == "betweenness":
+                print "Hubs and betweenness centrality:\n"
+            else:
+                print "Hubs and # of direct connections:\n"
+            for hub in hubs:
+                print "%s (%s)" % hub
+    elif cmds[0] in ["diameter", "radius", "eccentricity"]:
+        args = cmds[1:]
+        samples = None
+        if "--sample" in args and args.index("--sample") + 1 < len(args):
+            samples = args.pop(args.index("--sample") + 1)
+            args.remove("--sample")
+        if cmds[0] == "diameter":
+            diameter = airmap.diameter(samples)
+            if isinstance(diameter, basestring):
+                print diameter
+            else:
+                print "Network diameter: %s" % diameter
+        elif cmds[0] == "radius":
+            radius = airmap.radius(samples)
+            if isinstance(radius, basestring):
+                print radius
+            else:
+                print "Network radius: %s" % radius[0]
+                print "Center: %s" % ", ".join(radius[1])
+        elif len(args) > 0:
+            eccentricity = airmap.eccentricity(args[0], samples)
+            if isinstance(eccentricity, basestring):
+                print eccentricity
+            else:
+                print "Eccentricity of %s: %s" % (args[0], eccentricity)
         else:
-            hubs = airmap.hubs()
-        print "Hubs and # of direct connections:\n"
-        for hub in hubs:
-            print "%s (%s)" % hub
+            print HELP_MESSAGE
     elif cmds[0] == "visualize":
-        webbrowser.open(airmap.visualizer_url())
+        # imported here, as it is slow to import and rarely needed
+        import webbrowser
+        urls = airmap.visualizer_urls()
+        if len(urls) > 0:
+            webbrowser.open(urls[0])
+        if len(urls) > 1:
+            print "The routes do not fit in one map, so only the first of %s was opened.\n" % len(urls) + \
+                  "Use export <FILE> gcmap to get all of them."
     elif cmds[0] == "add_city" and len(cmds) >= 3:
         print airmap.add_city(cmds[1], cmds[2])
     elif cmds[0] == "remove_city" and len(cmds) >= 2:
@@ -95,16 +158,57 @@ def execute(cmd, airmap):
     elif cmds[0] == "remove_route" and len(cmds) >= 3:
         print airmap.remove_route(cmds[1], cmds[2])
     elif cmds[0] == "load" and len(cmds) >= 2:
-        print airmap.load_extra(cmds[1])
+        print airmap.load_extra(*cmds[1:])
     elif cmds[0] == "save":
-        if len(cmds) == 1:
-            print airmap.save(SAVED_STATE_FILE)
+        compact = "--compact" in cmds
+        args = [arg for arg in cmds[1:] if arg != "--compact"]
+        if len(args) == 0:
+            print airmap.save(SAVED_STATE_FILE, compact)
         else:
-            print airmap.save(cmds[1])
+            print airmap.save(args[0], compact)
+    elif cmds[0] == "export" and len(cmds) == 2:
+        print airmap.export(cmds[1])
+    elif cmds[0] == "export" and len(cmds) == 3:
+        print airmap.export(cmds[1], cmds[2])
     elif cmds[0] == "route_info" and len(cmds) >= 3:
         print airmap.route_info(cmds[1:])
     elif cmds[0] == "shortest_path" and len(cmds) == 3:
         print airmap.shortest_path(cmds[1], cmds[2])
+    elif cmds[0] == "distances" and len(cmds) == 3:
+        origins = cmds[1].split(',')
+        destinations = cmds[2].split(',')
+        matrix = airmap.distance_matrix(origins, destinations)
+        if isinstance(matrix, basestring):
+            print matrix
+        else:
+            print "\t" + "\t".join(destinations)
+            for i in range(len(origins)):
+                print origins[i] + "\t" + "\t".join([str(distance) for distance in matrix[i]])
+    elif cmds[0] == "k_shortest_paths" and len(cmds) == 3:
+        print airmap.k_shortest_paths(cmds[1], cmds[2])
+    elif cmds[0] == "k_shortest_paths" and len(cmds) == 4:
+        print airmap.k_shortest_paths(cmds[1], cmds[2], cmds[3])
+    elif cmds[0] == "fastest_path" and len(cmds) == 3:
+        print airmap.fastest_path(cmds[1], cmds[2])
+    elif cmds[0] == "cheapest_path" and len(cmds) == 3:
+        print airmap.cheapest_path(cmds[1], cmds[2])
+    elif cmds[0] == "route_options" and len(cmds) == 3:
+        print airmap.pareto_paths(cmds[1], cmds[2])
+    elif cmds[0] == "cache_stats":
+        print airmap.cache_stats()
+    elif cmds[0] == "profile":
+        if len(cmds) > 1:
+            result, counters, seconds = airmap.profile(execute, " ".join(cmds[1:]), airmap)
+            print "======== Profile ========"
+            print "Time: %s ms" % round(seconds * 1000, 2)
+            for name in sorted(counters):
+                print "%s: %s" % (name, counters[name])
+        else:
+            print "======== Memory usage ========"
+            for part, size in airmap.memory_usage():
+                print "%s: %s KB" % (part, round(size / 1024.0, 1))
+    elif cmds[0] == "track" and len(cmds) >= 2:
+        print airmap.track(cmds[1:])
     else:
         print HELP_MESSAGE
 
@@ -118,14 +222,16 @@ def run_cli():
     try:
         if path.isfile(SAVED_STATE_FILE):
             print "\nLoading saved state..."
-            # map data is saved in non-symmetric route format
-            airmap = Map(SAVED_STATE_FILE, symmetric_routes=False)
+            # map data records whether its routes are symmetric; older saves
+            # list each route once per direction, and are only stored
+            # undirected if every route has an equal route back
+            airmap = Map(SAVED_STATE_FILE, symmetric_routes=False, undirected=None, lazy=True)
         else:
             data_filename = raw_input("Please enter name of map data file \n(default is %s): " % DEFAULT_DATAFILE)
             if data_filename == "":
                 data_filename = DEFAULT_DATAFILE    
             print "\nLoading %s..." % data_filename 
-            airmap = Map(data_filename, symmetric_routes=True)  
+            airmap = Map(data_filename, symmetric_routes=True, undirected=None, lazy=True)
     except:
         e = sys.exc_info()[0]
         print "ERROR loading data file: %s" % e
@@ -1,8 +1,16 @@
 from graph import Graph
 from graph import Node
+from dynamic_sssp import DynamicShortestPaths
+from overlay import PartitionOverlay
+from result_cache import ResultCache
 import graph_parser
+import route_search
+import centrality
+import analytics
 import heapq
 import json
+import os
+import time
 from math import sqrt
 from fileinput import filename
 
@@ -23,19 +31,53 @@ class Map:
     PLANE_ACCELERATION = (PLANE_SPEED) / ACCELERATION_TIME
     
     
-    def __init__(self, data_file, symmetric_routes=True):
+    def __init__(self, data_file, symmetric_routes=True, undirected=False, lazy=False, cache_size=1024,
+                 precompute_overlay=False):
         """
         creates a new CSAir Map from the given json file
         :param data_file: the name of the json file to laod
         :param symmetric_routes: whether the routes in the file
             should be interpreted as symmetric edges
-        """
-        self.graph = graph_parser.load(data_file, symmetric_routes=symmetric_routes)
-        try:
-            with open(data_file) as data:
-                self.data_sources = json.load(data)["data sources"]
-        except:
-            self.data_sources = []
+        :param undirected: whether every route is flown in both directions,
+            so that each is stored and saved only once. if None, this is
+            decided by whether every route in the file has an equal route
+            back. the map is made directed again by the first one-way edit
+        :param lazy: whether to parse each city's data only when it is
+            first needed, rather than up front
+        :param cache_size: the maximum number of query results to cache
+        :param precompute_overlay: whether to compute the shortcuts between
+            the gateway cities of every continent up front, rather than as
+            routes between continents first need them
+        """
+        if lazy:
+            self.graph, fields = graph_parser.load_lazy(data_file, symmetric_routes=symmetric_routes, undirected=undirected)
+            self.data_sources = fields.get("data sources", [])
+        else:
+            self.graph = graph_parser.load(data_file, symmetric_routes=symmetric_routes, undirected=undirected)
+            try:
+                with open(data_file) as data:
+                    self.data_sources = json.load(data)["data sources"]
+            except:
+                self.data_sources = []
+            
+        # shortest path trees of frequently queried origins,
+        # repaired as routes change
+        self.tracked = DynamicShortestPaths(self.graph)
+        
+        # results of city_info, route_info and shortest_path, dropped
+        # as soon as the nodes or routes they were computed from change
+        self.cache = ResultCache(cache_size)
+        self.graph.add_listener(self._invalidate_cache)
+        
+        # shortcuts between the gateway cities of each continent, which
+        # route shortest paths between continents
+        self.overlay = PartitionOverlay(self.graph, self._continent, self._invalidate_continent)
+        if precompute_overlay:
+            self.overlay.build()
+        
+        # whole-network analyses, each stored with the graph version
+        # it was computed for
+        self._analyses = dict()
         
     def city_list(self):
         """
@@ -52,6 +94,21 @@ class Map:
         :param code: the code of the city
         :param field: the name of the field to narrow the info down to
         """
+        key = ("city_info", code, field)
+        info = self.cache.get(key)
+        if info is ResultCache.MISS:
+            info = self._city_info(code, field)
+            dependencies = [("node", code), ("data", code)]
+            if code in self.graph:
+                dependencies.append(("out", code))
+                dependencies.extend([("data", child) for child in self.graph.child_ids(code)])
+            self.cache.put(key, info, dependencies)
+        return info.copy()
+    
+    def _city_info(self, code, field):
+        """
+        computes city_info without the cache
+        """
         try:
             info = self.graph.node(code).data.copy()
         except:
@@ -88,13 +145,11 @@ class Map:
         """
         max_dist = -1
         cities = ["", ""]
-        for c1 in self.graph.edges:
-            for c2 in self.graph.edges[c1]:
-                dist = self.graph.edges[c1][c2]
-                if dist != None and dist > max_dist:
-                    max_dist = dist
-                    cities = [self.graph.node(c1).data["name"], self.graph.node(c2).data["name"]]
-        return (cities[0], cities[1], max_dist)
+        for c1, c2, dist in self.graph.iter_edges():
+            if dist > max_dist:
+                max_dist = dist
+                cities = [c1, c2]
+        return (self._city_name(cities[0]), self._city_name(cities[1]), max_dist)
     
     def shortest_flight(self):
         """
@@ -103,13 +158,19 @@ class Map:
         """
         min_dist = float("inf")
         cities = ["", ""]
-        for c1 in self.graph.edges:
-            for c2 in self.graph.edges[c1]:
-                dist = self.graph.edges[c1][c2]
-                if dist != None and dist < min_dist:
-                    min_dist = dist
-                    cities = [self.graph.node(c1).data["name"], self.graph.node(c2).data["name"]]
-        return (cities[0], cities[1], min_dist)
+        for c1, c2, dist in self.graph.iter_edges():
+            if dist < min_dist:
+                min_dist = dist
+                cities = [c1, c2]
+        return (self._city_name(cities[0]), self._city_name(cities[1]), min_dist)
+    
+    def _city_name(self, code):
+        """
+        :return: the name of the city of the given code, or "" if there is none
+        """
+        if code not in self.graph:
+            return ""
+        return self.graph.node(code).data["name"]
     
     def average_flight(self):
         """
@@ -117,12 +178,9 @@ class Map:
         """
         sum = 0
         count = 0
-        for c1 in self.graph.edges:
-            for c2 in self.graph.edges[c1]:
-                dist = self.graph.edges[c1][c2]
-                if dist != None:
-                    sum += dist
-                    count += 1
+        for c1, c2, dist in self.graph.iter_edges():
+            sum += dist
+            count += 1
         return sum / count
     
     def biggest_city(self):
@@ -178,29 +236,125 @@ class Map:
             cities[continent] = "\n\t" + "\n\t".join(cities[continent])
         return "\n".join(["%s: %s" % (continent, cities[continent]) for continent in cities])
     
-    def hubs(self, num=10):
+    def hubs(self, num=10, by="connections", samples=None):
         """
         :return: a list of num hub cities
-        each city is represented as a tuple of (name, # of direct connections)
+        each city is represented as a tuple of (name, score), where the score
+        is its # of direct connections, or its betweenness centrality
+        :param by: "connections" or "betweenness"
+        :param samples: the number of cities to estimate betweenness from,
+            or None to compute it exactly
         """
+        try:
+            num = int(num)
+        except:
+            return "Error: %s is not a valid number of hubs" % num
+        
+        if by == "betweenness":
+            scores = self.betweenness(samples)
+            if isinstance(scores, basestring):
+                return scores
+        elif by == "connections":
+            scores = dict([(nid, self.graph.out_deg(nid)) for nid in self.graph.node_ids()])
+        else:
+            return "Error: %s is not a valid way to rank hubs" % by
+        
         hubs = []
         for node in self.graph.nodes:
-            flight_count = sum([self.graph.edges[node.nid][dest] != None for dest in self.graph.edges[node.nid]])
-            # minheap sorts in ascending order, so negate flight_count
-            heapq.heappush(hubs, (-flight_count, node.data["name"]))
+            # minheap sorts in ascending order, so negate the score
+            heapq.heappush(hubs, (-scores[node.nid], node.data["name"]))
         return [(pair[1], -pair[0]) for pair in [heapq.heappop(hubs) for i in range(min(num, len(hubs)))]]
     
-    def visualizer_url(self):
+    def betweenness(self, samples=None):
         """
-        :return: the url of the gcmap.com map that visualizes the map data
+        :return: a dictionary from each city code to its betweenness
+            centrality, the number of shortest routes between other cities
+            that pass through it
+        :param samples: the number of cities to estimate it from,
+            or None to compute it exactly
         """
-        url = "http://www.gcmap.com/mapui?P="
-        routes = []
-        for c1 in self.graph.node_ids():
-            for c2 in self.graph.node_ids():
-                if self.graph.is_edge_between(c1, c2):
-                    routes.append("%s-%s" % (c1, c2))
-        return url + ",".join(routes)
+        samples = self._sample_count(samples)
+        if isinstance(samples, basestring):
+            return samples
+        
+        # sampled estimates use a fixed seed, so repeated calls agree
+        return self._analysis(("betweenness", samples),
+                              lambda: centrality.betweenness(self.graph, samples=samples, seed=0))
+    
+    def diameter(self, samples=None):
+        """
+        :return: the longest of the shortest routes between any two cities
+        :param samples: the number of searches to estimate it from,
+            or None to compute it exactly
+        """
+        samples = self._sample_count(samples)
+        if isinstance(samples, basestring):
+            return samples
+        return self._analysis(("diameter", samples), lambda: analytics.diameter(self.graph, samples))
+    
+    def eccentricity(self, code, samples=None):
+        """
+        :return: the length of the longest shortest route from the given city
+        :param samples: the number of searches to estimate it from,
+            or None to compute it exactly
+        """
+        samples = self._sample_count(samples)
+        if isinstance(samples, basestring):
+            return samples
+        eccentricities = self._analysis(("eccentricities", samples),
+                                        lambda: analytics.eccentricities(self.graph, samples))
+        if code not in eccentricities:
+            return "Error: %s not a valid code" % code
+        return eccentricities[code]
+    
+    def radius(self, samples=None):
+        """
+        :return: a tuple of the smallest eccentricity of any well connected
+            city, and a list of the names of the cities with it, the center
+        :param samples: the number of searches to estimate it from,
+            or None to compute it exactly
+        """
+        samples = self._sample_count(samples)
+        if isinstance(samples, basestring):
+            return samples
+        value, center = self._analysis(("radius", samples), lambda: analytics.radius(self.graph, samples))
+        return (value, [self.graph.node(code).data["name"] for code in center])
+    
+    def _sample_count(self, samples):
+        """
+        :return: the given number of samples as an int, None if it is None,
+            or an error message if it is not a number of at least 1
+        """
+        if samples == None:
+            return None
+        try:
+            count = int(samples)
+        except:
+            count = 0
+        if count < 1:
+            return "Error: %s is not a valid number of samples" % samples
+        return count
+    
+    def _analysis(self, key, compute):
+        """
+        :return: the result of compute, reused until the graph changes
+        """
+        if key not in self._analyses or self._analyses[key][0] != self.graph.version:
+            self._analyses[key] = (self.graph.version, compute())
+        return self._analyses[key][1]
+    
+    def visualizer_urls(self):
+        """
+        :return: a list of the urls of the gcmap.com maps that together
+            visualize the map data, each short enough for a browser to open
+        """
+        # imported here, as they are only needed for exporting
+        import exporters
+        from StringIO import StringIO
+        
+        out = StringIO()
+        exporters.write_gcmap_urls(out, self.graph.iter_edges())
+        return out.getvalue().splitlines()
     
     def remove_city(self, code):
         """
@@ -242,6 +396,9 @@ class Map:
         removes the route between the given cities from the map
         """
         try:
+            # routes are edited one way, which an undirected graph cannot store
+            if self.graph.undirected and self.graph.is_edge_between(src, dst):
+                self.graph.make_directed()
             self.graph.remove_edge(src, dst)
             return "Removed %s-%s" % (src, dst)
         except:
@@ -252,6 +409,9 @@ class Map:
         adds a route between the given cities to the map
         """
         try:
+            # routes are edited one way, which an undirected graph cannot store
+            if self.graph.undirected and self.graph.edge(src, dst) != int(distance):
+                self.graph.make_directed()
             self.graph.add_edge(src, dst, int(distance))
             return "Added %s-%s" % (src, dst)
         except:
@@ -267,79 +427,232 @@ class Map:
             value = value
             
         try:
-            self.graph.node(city).data[field] = value
+            data = self.graph.node(city).data
+            data[field] = value
+            self.graph.set_node_data(city, data)
             return "Updated %s" % city
         except:
             return "Error: could not update %s with given value" % city
         
-    def load_extra(self, filename):
+    def load_extra(self, *filenames):
         """
         loads extra route and city data into the map
-        :param filename: the name of a json data file
+        :param filenames: the names of json data files, or of directories
+            of json data files, which are parsed in parallel
         """
         try:
-            graph_parser.load_extra(self.graph, filename, symmetric_routes=True)
-            return "Loaded %s" % filename
+            loaded = graph_parser.expand_paths(filenames)
+            conflicts = graph_parser.load_many(self.graph, loaded, symmetric_routes=True)
         except:
-            return "Error: Could not load %s" % filename
+            return "Error: Could not load %s" % ", ".join(filenames)
+        
+        message = "Loaded %s" % ", ".join(loaded)
+        if len(conflicts) > 0:
+            message += "\n%s conflicts:\n\t" % len(conflicts) + "\n\t".join(conflicts)
+        return message
         
-    def save(self, filename):
+    def save(self, filename, compact=False):
         """
-        saves the map data to the given filename in json form
+        saves the map data to the given filename in json form. the data is
+        streamed to a temporary file that replaces filename only once it
+        is completely written, so a failed save leaves filename untouched
+        :param compact: whether to write the json without indentation
         """
+        if not self._write_file(filename, lambda save_file: self._write_json(save_file, compact)):
+            return "Error: Could not save to %s" % filename
+        return "Saved to %s" % filename
+    
+    def export(self, filename, format="csv"):
+        """
+        exports the map's routes to the given filename, streaming them to
+        the file one at a time. as with save, a failed export leaves
+        filename untouched
+        :param format: "csv" for a list of routes, "geojson" for a feature
+            collection of the cities and routes, or "gcmap" for gcmap.com
+            urls that together show every route, one per line
+        """
+        # imported here, as it is only needed for exporting
+        import exporters
         
-        json_dict = dict()
-        json_dict["data sources"] = self.data_sources
+        if format == "csv":
+            write = lambda out: exporters.write_csv(out, ["src", "dst", "distance"], self.graph.iter_edges())
+        elif format == "geojson":
+            write = lambda out: exporters.write_geojson(out, self._geojson_features())
+        elif format == "gcmap":
+            write = lambda out: exporters.write_gcmap_urls(out, self.graph.iter_edges())
+        else:
+            return "Error: %s is not a valid export format" % format
         
-        metros = []
-        for city in self.graph.nodes:
-            metros.append(city.data)
-        json_dict["metros"] = metros
-            
-        routes = []
-        for src in self.graph.node_ids():
-            for dst in self.graph.child_ids(src):
-                routes.append({
-                    "ports": [src, dst],
-                    "distance": self.graph.distance_between(src, dst)
-                })
-        json_dict["routes"] = routes
-               
-        try: 
-            with open(filename, 'w') as save_file:
-                json.dump(json_dict, save_file, indent=4)
-                save_file.close()
-            return "Saved to %s" % filename
+        if not self._write_file(filename, write):
+            return "Error: Could not export to %s" % filename
+        return "Exported to %s" % filename
+    
+    def _geojson_features(self):
+        """
+        generates a GeoJSON point feature for every city, and a line feature
+        for every route, leaving out those whose coordinates are unknown
+        """
+        for node in self.graph.nodes:
+            position = self._position(node.nid)
+            if position != None:
+                yield {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": position},
+                    "properties": {"code": node.nid, "name": node.data["name"]}
+                }
+        for src, dst, distance in self.graph.iter_edges():
+            positions = [self._position(src), self._position(dst)]
+            if None not in positions:
+                yield {
+                    "type": "Feature",
+                    "geometry": {"type": "LineString", "coordinates": positions},
+                    "properties": {"ports": [src, dst], "distance": distance}
+                }
+    
+    def _position(self, code):
+        """
+        :return: the [longitude, latitude] of the given city, in degrees
+            east and north, or None if its coordinates are unknown
+        """
+        try:
+            coords = self.graph.node(code).data["coordinates"]
+            latitude = coords["N"] if "N" in coords else -coords["S"]
+            longitude = coords["E"] if "E" in coords else -coords["W"]
         except:
-            return "Error: Could not save to %s" % filename
+            return None
+        return [longitude, latitude]
+    
+    def _write_file(self, filename, write):
+        """
+        calls write with a temporary file that replaces filename only once
+        it is completely written, so that a failure leaves filename untouched
+        :return: whether filename was written
+        """
+        # imported here, as they are only needed for writing files
+        import shutil
+        import tempfile
+        
+        try:
+            directory = os.path.dirname(os.path.abspath(filename))
+            fd, temp_filename = tempfile.mkstemp(prefix=".csair-", suffix=".tmp", dir=directory)
+        except:
+            return False
+        
+        try:
+            with os.fdopen(fd, 'w') as save_file:
+                write(save_file)
+                save_file.flush()
+                os.fsync(save_file.fileno())
+            # mkstemp creates files readable only by their owner
+            if os.path.exists(filename):
+                shutil.copymode(filename, temp_filename)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(temp_filename, 0o666 & ~umask)
+            os.rename(temp_filename, filename)
+        except:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            return False
+        
+        # make the rename itself durable, where the platform allows it
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+        return True
+    
+    def _write_json(self, save_file, compact):
+        """
+        writes the map data to save_file as a json object, one metro
+        and one route at a time
+        """
+        if compact:
+            save_file.write('{"data sources":%s,' % json.dumps(self.data_sources, separators=(',', ':')))
+            save_file.write('"symmetric routes":%s,' % json.dumps(self.graph.undirected))
+        else:
+            save_file.write('{\n    "data sources": %s,' % self._indent(json.dumps(self.data_sources, indent=4), 4))
+            save_file.write('\n    "symmetric routes": %s,' % json.dumps(self.graph.undirected))
+        self._write_json_array(save_file, "metros", (city.data for city in self.graph.nodes), compact)
+        save_file.write(",")
+        self._write_json_array(save_file, "routes", self._route_dicts(), compact)
+        save_file.write("}\n" if compact else "\n}\n")
+        
+    def _write_json_array(self, save_file, name, items, compact):
+        """
+        writes a "name": [items] member of a json object to save_file,
+        without building the list in memory
+        """
+        if compact:
+            save_file.write('%s:[' % json.dumps(name))
+        else:
+            save_file.write('\n    %s: [' % json.dumps(name))
+        
+        first = True
+        for item in items:
+            if compact:
+                save_file.write(("" if first else ",") + json.dumps(item, separators=(',', ':')))
+            else:
+                save_file.write(("\n        " if first else ",\n        ") + self._indent(json.dumps(item, indent=4), 8))
+            first = False
+        
+        save_file.write("]" if compact or first else "\n    ]")
+        
+    def _indent(self, text, width):
+        """
+        :return: text with every line but the first indented by width spaces
+        """
+        return text.replace("\n", "\n" + " " * width)
+        
+    def _route_dicts(self):
+        """
+        generates the json form of every route in the map. routes of an
+        undirected map are generated once, rather than once per direction
+        """
+        for src, dst, distance in self.graph.iter_edges():
+            yield {
+                "ports": [src, dst],
+                "distance": distance
+            }
         
     def route_info(self, route):
         """
         :return: info on the provided route, including distance, cost, and time
         :param route: a list of city ids representing a route
         """
+        key = ("route_info", tuple(route))
+        info = self.cache.get(key)
+        if info is ResultCache.MISS:
+            info = self._route_info(route)
+            # the route's flights and layovers depend on the outbound
+            # routes of every city but the last
+            dependencies = [("node", city) for city in route] + \
+                [("out", city) for city in route[:-1]]
+            self.cache.put(key, info, dependencies)
+        return info
+    
+    def _route_info(self, route):
+        """
+        computes route_info without the cache
+        """
         if not self.graph.is_valid_path(route):
             return "Error: Given route is invalid"
         
         distance = self.graph.path_length(route)
         
-        current_cost = self.PRICE_PER_KM
+        leg_rates = self._leg_rates()
         total_cost = 0.0
-        for i in range(len(route) - 1):
-            if current_cost > 0:
-                total_cost += current_cost * self.graph.distance_between(route[i], route[i+1])
-                current_cost -= self.CONNECTING_DISCOUNT
-            else:
-                break
+        for i in range(min(len(route) - 1, len(leg_rates))):
+            total_cost += leg_rates[i] * self.graph.distance_between(route[i], route[i+1])
             
         total_time = 0
         for i in range(len(route) - 1):
-            d = self.graph.distance_between(route[i], route[i+1])
-            if d > 400:
-                total_time += (2*self.ACCELERATION_TIME) + ((d - (2*self.ACCELERATION_DISTANCE))/self.PLANE_SPEED)
-            else:
-                total_time += 2 * sqrt(d / self.PLANE_ACCELERATION)
-                
+            total_time += self._flight_time(self.graph.distance_between(route[i], route[i+1]))
             if i > 0:
                 total_time += self._layover_time(route[i])
             
@@ -348,6 +661,28 @@ class Map:
                 ("Total cost: $%s\n" % round(total_cost, 2)) + \
                 ("Total time: %s hours\n" % round(total_time, 2))
                 
+    def _leg_rates(self):
+        """
+        :return: a list of the price per km of each leg of a route,
+            up to the first leg that is free
+        """
+        rates = []
+        current_cost = self.PRICE_PER_KM
+        while current_cost > 0:
+            rates.append(current_cost)
+            current_cost -= self.CONNECTING_DISCOUNT
+        return rates
+    
+    def _flight_time(self, distance):
+        """
+        :return: the time in hours of a single flight of the given distance,
+            accounting for acceleration and deceleration
+        """
+        if distance > 2 * self.ACCELERATION_DISTANCE:
+            return (2*self.ACCELERATION_TIME) + ((distance - (2*self.ACCELERATION_DISTANCE))/self.PLANE_SPEED)
+        else:
+            return 2 * sqrt(distance / self.PLANE_ACCELERATION)
+                
     def _layover_time(self, city):
         """
         :return: the layover time for the given city
@@ -361,11 +696,242 @@ class Map:
         :return: the shortest route between src and dst, as well
             as info on that route
         """
+        key = ("shortest_path", src, dst)
+        result = self.cache.get(key)
+        if result is not ResultCache.MISS:
+            return result
         
-        path = self.graph.dijkstras(src, dst)
+        # a new or shorter route can only change the answer if it leaves a
+        # city that is closer to src than dst is, and those are exactly
+        # the cities a search settles
+        settled = set()
+        dependencies = [("node", src), ("node", dst)]
+        if src in self.tracked:
+            path = self.tracked.path(src, dst)
+            limit = self.tracked.distance(src, dst)
+            settled.update([city for city, distance in self.tracked.trees[src].dist.items() if distance <= limit])
+        elif src in self.graph and dst in self.graph and self.overlay.partition(src) != self.overlay.partition(dst):
+            # routes between continents are searched over the overlay, which
+            # can only change through routes leaving the continents it entered
+            continents = set()
+            path = self.overlay.path(src, dst, continents)
+            dependencies.extend([("continent", continent) for continent in continents])
+        else:
+            path = self.graph.dijkstras(src, dst, settled)
         
+        result = self._shortest_path_info(path)
+        dependencies.extend([("out", city) for city in settled])
+        self.cache.put(key, result, dependencies)
+        return result
+    
+    def _shortest_path_info(self, path):
+        """
+        :return: the shortest path message for the given path
+        """
         if path == None:
             return "Error: Could not find path between the given cities"
         
         return ("Shortest route: %s\n\n" % '-'.join(path)) + \
-                self.route_info(path)     
\ No newline at end of file
+                self.route_info(path)
+    
+    def distance_matrix(self, origins, destinations, paths=False):
+        """
+        :return: a matrix whose [i][j] entry is the length of the shortest
+            route from origins[i] to destinations[j], or infinity if there
+            is none. the matrix is a numpy array if numpy is installed, and
+            a list of lists otherwise. if paths is set, a tuple of the matrix
+            and a list of lists of the matching routes is returned instead
+        :param origins: a list of city codes
+        :param destinations: a list of city codes
+        :param paths: whether to also return the routes themselves
+        """
+        for code in list(origins) + list(destinations):
+            if code not in self.graph:
+                return "Error: %s not a valid code" % code
+        
+        # imported here, as numpy is optional and slow to import
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        
+        matrix = []
+        routes = []
+        for origin in origins:
+            # a single search per origin, stopped once every destination is known
+            dists, parents = self.graph.distances_from(origin, destinations)
+            matrix.append([dists.get(dst, float("inf")) for dst in destinations])
+            if paths:
+                routes.append([self._parent_path(parents, dst) for dst in destinations])
+        
+        if numpy != None:
+            matrix = numpy.array(matrix, dtype=float).reshape(len(origins), len(destinations))
+        
+        if paths:
+            return (matrix, routes)
+        return matrix
+    
+    def _parent_path(self, parents, dst):
+        """
+        :return: the route ending at dst that follows the given parent
+            mapping back to its root, or None if dst was not reached
+        """
+        if dst not in parents:
+            return None
+        path = []
+        cur_node = dst
+        while cur_node != None:
+            path.append(cur_node)
+            cur_node = parents[cur_node]
+        return path[::-1]
+    
+    def k_shortest_paths(self, src, dst, k=3):
+        """
+        :return: up to k of the shortest routes between src and dst, in
+            order of increasing distance, each with info on that route
+        """
+        try:
+            k = int(k)
+        except:
+            return "Error: %s is not a valid number of routes" % k
+        
+        paths = self.graph.k_shortest_paths(src, dst, k)
+        
+        if len(paths) == 0:
+            return "Error: Could not find path between the given cities"
+        
+        return "\n".join([("Route %s: %s\n\n" % (i + 1, '-'.join(path))) + self.route_info(path)
+                          for i, path in enumerate(paths)])
+    
+    def fastest_path(self, src, dst):
+        """
+        :return: the route between src and dst with the smallest total
+            time, including layovers, as well as info on that route
+        """
+        result = route_search.fastest_path(self.graph, src, dst, self._flight_time, self._layover_time)
+        
+        if result == None:
+            return "Error: Could not find path between the given cities"
+        
+        return ("Fastest route: %s\n\n" % '-'.join(result[0])) + \
+                self.route_info(result[0])
+    
+    def cheapest_path(self, src, dst):
+        """
+        :return: the route between src and dst with the smallest total
+            cost, as well as info on that route
+        """
+        result = route_search.cheapest_path(self.graph, src, dst, self._leg_rates())
+        
+        if result == None:
+            return "Error: Could not find path between the given cities"
+        
+        return ("Cheapest route: %s\n\n" % '-'.join(result[0])) + \
+                self.route_info(result[0])
+    
+    def pareto_paths(self, src, dst, max_hops=None):
+        """
+        :return: every route between src and dst that no other route beats
+            on total time, total cost and number of flights at once
+        :param max_hops: the maximum number of flights in a route, if any
+        """
+        results = route_search.pareto_paths(self.graph, src, dst, self._flight_time,
+                                            self._layover_time, self._leg_rates(), max_hops)
+        
+        if len(results) == 0:
+            return "Error: Could not find path between the given cities"
+        
+        return "======== Route options ========\n" + \
+                "".join([("%s: %s hours, $%s, %s flights\n" % ('-'.join(path), round(time, 2), round(cost, 2), len(path) - 1))
+                         for path, time, cost in results])
+    
+    def cache_stats(self):
+        """
+        :return: a summary of the query result cache's usage
+        """
+        lookups = self.cache.hits + self.cache.misses
+        hit_rate = 100.0 * self.cache.hits / lookups if lookups > 0 else 0.0
+        return  "======== Cache stats ========\n" + \
+                ("Cached results: %s of %s\n" % (len(self.cache), self.cache.capacity)) + \
+                ("Hits: %s\n" % self.cache.hits) + \
+                ("Misses: %s\n" % self.cache.misses) + \
+                ("Hit rate: %s%%\n" % round(hit_rate, 1))
+    
+    def profile(self, query, *args):
+        """
+        runs query(*args), counting the work done by the graph's algorithms
+        :param query: a function, such as one of this map's methods
+        :return: a tuple of query's result, a dictionary from the names of
+            the graph's counters to their counts, which also counts the
+            result cache's "cache_hits" and "cache_misses", and the time
+            the query took in seconds
+        """
+        hits = self.cache.hits
+        misses = self.cache.misses
+        self.graph.start_counting()
+        start = time.time()
+        try:
+            result = query(*args)
+        finally:
+            seconds = time.time() - start
+            counters = self.graph.stop_counting()
+        counters["cache_hits"] = self.cache.hits - hits
+        counters["cache_misses"] = self.cache.misses - misses
+        return (result, counters, seconds)
+    
+    def memory_usage(self):
+        """
+        :return: a list of (part, bytes) pairs of the memory taken by the
+            map's "metros", "nodes", "edges" and "caches", which hold the
+            results of queries and analyses and the routing overlay, followed
+            by their "total". objects shared between parts are counted in
+            the first only
+        """
+        # imported here, as it is only needed for profiling
+        from profiling import deep_sizeof
+        
+        seen = set([id(self)])
+        usage = self.graph.memory_usage(seen)
+        usage.append(("caches", deep_sizeof([self.cache, self._analyses, self.tracked, self.overlay], seen)))
+        usage.append(("total", sum([size for part, size in usage])))
+        return usage
+    
+    def _invalidate_cache(self, event, *args):
+        """
+        graph listener that drops cached results affected by a change
+        """
+        if event == "edge":
+            self.cache.invalidate(("out", args[0]))
+        elif event == "node_data":
+            self.cache.invalidate(("data", args[0]))
+        else:
+            self.cache.invalidate(("node", args[0]))
+            self.cache.invalidate(("data", args[0]))
+    
+    def _invalidate_continent(self, continent):
+        """
+        overlay callback that drops cached routes through the given continent
+        """
+        self.cache.invalidate(("continent", continent))
+    
+    def _continent(self, code):
+        """
+        :return: the continent of the given city, or None if it has none
+        """
+        try:
+            return self.graph.node(code).field("continent")
+        except:
+            return None
+    
+    def track(self, codes):
+        """
+        keeps the shortest path trees of the given cities up to date,
+        so that shortest paths from them are answered without a search
+        :param codes: a list of city codes
+        """
+        for code in codes:
+            if code not in self.graph:
+                return "Error: %s not a valid code" % code
+        for code in codes:
+            self.tracked.track(code)
+        return "Tracking %s" % ", ".join(self.tracked.origins())
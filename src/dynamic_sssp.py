@@ -0,0 +1,222 @@
+import heapq
+
+INF = float("inf")
+
+class ShortestPathTree:
+    """
+    ShortestPathTree: the shortest paths from a single origin to every
+    node in a graph, repaired incrementally as the graph's edges change
+    """
+
+    def __init__(self, graph, origin):
+        """
+        builds the shortest path tree of the given origin
+        :param graph: the Graph to track
+        :param origin: the id of the root node
+        """
+        self.graph = graph
+        self.origin = origin
+
+        # dist maps each node to its distance from origin
+        self.dist = dict()
+        # parent maps each node to its parent in the tree, or None
+        self.parent = dict()
+        # tree_children maps each node to the set of its children in the tree
+        self.tree_children = dict()
+
+        for nid in graph.node_ids():
+            self.dist[nid] = INF
+            self.parent[nid] = None
+            self.tree_children[nid] = set()
+
+        self.dist[origin] = 0
+        self._propagate([(0, origin)])
+
+    def distance(self, dst):
+        """
+        :return: the length of the shortest path from origin to dst,
+            or infinity if dst is unreachable
+        """
+        return self.dist.get(dst, INF)
+
+    def path(self, dst):
+        """
+        :return: a list of node ids representing a minimum path
+            from origin to dst, or None if there is no such path
+        """
+        if self.distance(dst) == INF:
+            return None
+
+        path = []
+        cur_node = dst
+        while cur_node != None:
+            path.append(cur_node)
+            cur_node = self.parent[cur_node]
+        return path[::-1]
+
+    def edge_changed(self, src, dst, old_length, new_length):
+        """
+        repairs the tree after the edge from src to dst changed length.
+        a length of None means that there is no edge
+        """
+        old_length = INF if old_length == None else old_length
+        new_length = INF if new_length == None else new_length
+
+        if new_length < old_length:
+            # an insertion or decrease can only improve dst and the nodes
+            # reached through it
+            new_dist = self.dist[src] + new_length
+            if new_dist < self.dist[dst]:
+                self._attach(dst, src, new_dist)
+                self._propagate([(new_dist, dst)])
+        elif new_length > old_length and self.parent[dst] == src:
+            # a deletion or increase only matters for a tree edge, and then
+            # only for the subtree hanging from it
+            self._repair_subtree(dst)
+
+    def node_added(self, nid):
+        """
+        starts tracking a new, unconnected node
+        """
+        self.dist[nid] = INF
+        self.parent[nid] = None
+        self.tree_children[nid] = set()
+
+    def node_removed(self, nid):
+        """
+        stops tracking a node. its edges must already have been removed
+        """
+        del self.dist[nid]
+        del self.parent[nid]
+        del self.tree_children[nid]
+
+    def _attach(self, nid, parent, dist):
+        """
+        moves nid under parent in the tree, at the given distance
+        """
+        old_parent = self.parent[nid]
+        if old_parent != None:
+            self.tree_children[old_parent].discard(nid)
+        self.parent[nid] = parent
+        if parent != None:
+            self.tree_children[parent].add(nid)
+        self.dist[nid] = dist
+
+    def _propagate(self, heap):
+        """
+        runs Dijkstra's algorithm from the given (distance, node id) entries,
+        improving every node that can be reached more cheaply through them
+        """
+        heapq.heapify(heap)
+        while len(heap) > 0:
+            distance, node = heapq.heappop(heap)
+            if distance > self.dist[node]:
+                # stale heap entry
+                continue
+            for child in self.graph.child_ids(node):
+                new_dist = distance + self.graph.edge(node, child)
+                if new_dist < self.dist[child]:
+                    self._attach(child, node, new_dist)
+                    heapq.heappush(heap, (new_dist, child))
+
+    def _repair_subtree(self, root):
+        """
+        recomputes the distances of root and all of its descendants in the
+        tree, after the edge from root's parent became longer
+        """
+        # collect the affected subtree
+        affected = set()
+        stack = [root]
+        while len(stack) > 0:
+            node = stack.pop()
+            affected.add(node)
+            stack.extend(self.tree_children[node])
+
+        # detach it from the tree
+        for node in affected:
+            self._attach(node, None, INF)
+
+        # find the best way into each affected node from the rest of the tree
+        heap = []
+        for node in affected:
+            for parent in self.graph.parent_ids(node):
+                if parent in affected:
+                    continue
+                new_dist = self.dist[parent] + self.graph.edge(parent, node)
+                if new_dist < self.dist[node]:
+                    self._attach(node, parent, new_dist)
+            if self.dist[node] < INF:
+                heap.append((self.dist[node], node))
+
+        self._propagate(heap)
+
+
+class DynamicShortestPaths:
+    """
+    DynamicShortestPaths: shortest path trees for a set of origins in a
+    graph, kept up to date as the graph changes
+    """
+
+    def __init__(self, graph, origins=()):
+        """
+        :param graph: the Graph to track
+        :param origins: the ids of the nodes to build trees for
+        """
+        self.graph = graph
+        self.trees = dict()
+        for origin in origins:
+            self.track(origin)
+        graph.add_listener(self._on_change)
+
+    def __contains__(self, origin):
+        return origin in self.trees
+
+    def track(self, origin):
+        """
+        starts maintaining the shortest path tree of the given origin
+        """
+        if origin not in self.trees:
+            self.trees[origin] = ShortestPathTree(self.graph, origin)
+
+    def untrack(self, origin):
+        """
+        stops maintaining the shortest path tree of the given origin
+        """
+        self.trees.pop(origin, None)
+
+    def origins(self):
+        """
+        :return: a list of the ids of all tracked origins
+        """
+        return list(self.trees)
+
+    def path(self, src, dst):
+        """
+        :return: a list of node ids representing a minimum path from
+            the tracked origin src to dst, or None if there is no such path
+        """
+        if dst not in self.graph:
+            return None
+        return self.trees[src].path(dst)
+
+    def distance(self, src, dst):
+        """
+        :return: the length of the shortest path from the tracked origin
+            src to dst, or infinity if there is no such path
+        """
+        return self.trees[src].distance(dst)
+
+    def _on_change(self, event, *args):
+        """
+        graph listener that repairs every tree affected by a change
+        """
+        if event == "edge":
+            for tree in self.trees.values():
+                tree.edge_changed(*args)
+        elif event == "add_node":
+            for tree in self.trees.values():
+                tree.node_added(args[0])
+        elif event == "remove_node":
+            self.untrack(args[0])
+            for tree in self.trees.values():
+                tree.node_removed(args[0])
@@ -0,0 +1,53 @@
+import csv
+import json
+
+GCMAP_URL = "http://www.gcmap.com/mapui?P="
+
+# the longest url most browsers and servers accept
+GCMAP_MAX_LENGTH = 2000
+
+def write_gcmap_urls(out, routes, max_length=GCMAP_MAX_LENGTH):
+    """
+    writes gcmap.com urls that together show the given routes, one per
+    line. each url is at most max_length characters long, unless it
+    holds a single route that is longer
+    :param out: the file to write to
+    :param routes: an iterable of (src, dst, distance) tuples
+    """
+    segments = []
+    length = len(GCMAP_URL)
+    for src, dst, distance in routes:
+        segment = "%s-%s" % (src, dst)
+        if len(segments) > 0 and length + 1 + len(segment) > max_length:
+            out.write(GCMAP_URL + ",".join(segments) + "\n")
+            segments = []
+            length = len(GCMAP_URL)
+        length += len(segment) + (1 if len(segments) > 0 else 0)
+        segments.append(segment)
+    if len(segments) > 0:
+        out.write(GCMAP_URL + ",".join(segments) + "\n")
+
+def write_csv(out, header, rows):
+    """
+    writes a csv file, one row at a time
+    :param out: the file to write to
+    :param header: a list of the column names
+    :param rows: an iterable of rows, each a sequence of values
+    """
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+
+def write_geojson(out, features):
+    """
+    writes a GeoJSON feature collection, one feature at a time
+    :param out: the file to write to
+    :param features: an iterable of GeoJSON feature dictionaries
+    """
+    out.write('{"type": "FeatureCollection", "features": [')
+    first = True
+    for feature in features:
+        out.write(("\n" if first else ",\n") + json.dumps(feature))
+        first = False
+    out.write("]}\n" if first else "\n]}\n")
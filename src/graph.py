@@ -1,9 +1,46 @@
+import heapq
+
+# LazyData: node data that is only loaded the first time it is accessed
+class LazyData:
+    
+    # load: a function that returns the data when called with args
+    def __init__(self, load, *args):
+        self._load = load
+        self._args = args
+        # fields of the data that are known without loading it
+        self.fields = dict()
+        
+    def load(self):
+        return self._load(*self._args)
+
 # Node: A single node in a graph
-class Node:
+class Node(object):
         
     def __init__(self, nid, data):
         self.nid = nid
-        self.data = data
+        self._data = data
+        
+    # the node's data, loaded first if it was given as LazyData
+    @property
+    def data(self):
+        if isinstance(self._data, LazyData):
+            self._data = self._data.load()
+        return self._data
+    
+    @data.setter
+    def data(self, data):
+        self._data = data
+        
+    # returns the given field of the node's data, without loading
+    # the data if the field is already known
+    def field(self, key):
+        if isinstance(self._data, LazyData) and key in self._data.fields:
+            return self._data.fields[key]
+        return self.data[key]
+        
+    # returns whether the node's data has been loaded
+    def is_loaded(self):
+        return not isinstance(self._data, LazyData)
         
     def __hash__(self):
         return hash(self.nid)
@@ -19,7 +56,10 @@ class Graph:
     
     # node_data: a dictionary whose keys are unique identifiers, and
     # whose values are any data desired to be stored in each node
-    def __init__(self, node_data):
+    # undirected: whether every edge connects its nodes in both directions
+    def __init__(self, node_data, undirected=False):
+        
+        self.undirected = undirected
         
         # A list of Nodes
         self.nodes = [Node(nid, node_data[nid]) for nid in node_data]
@@ -31,12 +71,41 @@ class Graph:
             
         # An adjacency matrix
         # edges[i][j] is the length of the edge between nodes i and j
-        # or None if they are not adjacent
+        # or None if they are not adjacent. an undirected graph only
+        # stores the upper triangle, where i <= j
         self.edges = dict()
+        if undirected:
+            nids = sorted(self._node_indices)
+            for index in range(len(nids)):
+                self.edges[nids[index]] = dict.fromkeys(nids[index:])
+        else:
+            for node in self.nodes:
+                self.edges[node.nid] = dict.fromkeys(self._node_indices)
+        
+        # Sparse indices of the edges in the adjacency matrix
+        # _succ[i] maps each child of node i to the edge length, and
+        # _pred[j] maps each parent of node j to the edge length.
+        # in an undirected graph children and parents are the same
+        self._succ = dict()
         for node in self.nodes:
-            self.edges[node.nid] = dict()
-            for other_node in self.nodes:
-                self.edges[node.nid][other_node.nid] = None
+            self._succ[node.nid] = dict()
+        if undirected:
+            self._pred = self._succ
+        else:
+            self._pred = dict()
+            for node in self.nodes:
+                self._pred[node.nid] = dict()
+        
+        # Callbacks to notify of changes to the graph, and a counter
+        # that is incremented on every change
+        self._listeners = []
+        self.version = 0
+        
+        # Counts of the work done by the graph's algorithms, by name,
+        # or None when counting is off, and the counts of any enclosing
+        # start_counting calls
+        self.counters = None
+        self._outer_counters = []
             
     # :return: whether or not the graph contains a node of the given id
     def __contains__(self, node_id):
@@ -57,6 +126,8 @@ class Graph:
     # returns the length of the edge between the given nodes,
     # or None if they are not connected
     def edge(self, src_nid, dst_nid):
+        if self.undirected and dst_nid < src_nid:
+            return self.edges[dst_nid][src_nid]
         return self.edges[src_nid][dst_nid]
     
     # adds a new node with the given id and data to the graph
@@ -68,17 +139,31 @@ class Graph:
         self._node_indices[nid] = len(self.nodes) - 1
         self.edges[nid] = dict()
         for other_node in self.nodes:
-            self.edges[nid][other_node.nid] = None
+            if not self.undirected or nid <= other_node.nid:
+                self.edges[nid][other_node.nid] = None
+            if not self.undirected or other_node.nid <= nid:
+                self.edges[other_node.nid][nid] = None
+        self._succ[nid] = dict()
+        self._pred[nid] = dict()
+        self._notify("add_node", nid)
           
     # updates the given node's data  
     def set_node_data(self, nid, data):
         self.node(nid).data = data
+        self._notify("node_data", nid)
     
     # removes the given node from the graph
     def remove_node(self, nid):
         if nid not in self:
             return
         
+        # remove all edges to/from this node first, so that
+        # listeners see each of them disappear
+        for child in list(self._succ[nid]):
+            self.remove_edge(nid, child)
+        for parent in list(self._pred[nid]):
+            self.remove_edge(parent, nid)
+        
         # remove node
         del self.nodes[self.node_index(nid)]
         
@@ -86,15 +171,37 @@ class Graph:
         del self._node_indices[nid]
         for index in range(len(self.nodes)):
             self._node_indices[self.nodes[index].nid] = index
+        self.count("index_rebuilds")
+        self.count("reindexed", len(self.nodes))
             
         # remove all edges to/from this node
         for other_node in self.edges:
-            del self.edges[other_node][nid]
+            self.edges[other_node].pop(nid, None)
         del self.edges[nid]
+        self._succ.pop(nid, None)
+        self._pred.pop(nid, None)
+        self._notify("remove_node", nid)
+    
+    # switches an undirected graph to storing each direction of an edge
+    # on its own, so that the two directions can then differ. no edge
+    # changes, so listeners are not notified
+    def make_directed(self):
+        if not self.undirected:
+            return
+        
+        self.undirected = False
+        for node in self.nodes:
+            self.edges[node.nid] = dict.fromkeys(self._node_indices)
+        for src_nid in self._succ:
+            for dst_nid, length in self._succ[src_nid].items():
+                self.edges[src_nid][dst_nid] = length
+        self._pred = dict()
+        for nid in self._succ:
+            self._pred[nid] = dict(self._succ[nid])
     
     # creates an edge between the given nodes
     def add_edge(self, src_nid, dst_nid, length):
-        self.edges[src_nid][dst_nid] = length
+        self._set_edge(src_nid, dst_nid, length)
         
     # creates edges in both directions between the given nodes
     def add_symmetric_edge(self, n1, n2, length):
@@ -103,11 +210,96 @@ class Graph:
         
     # removes the edge between the given nodes
     def remove_edge(self, src_nid, dst_nid):
-        self.edges[src_nid][dst_nid] = None
+        self._set_edge(src_nid, dst_nid, None)
+        
+    # sets the length of the edge between the given nodes, keeping the
+    # sparse indices up to date. a length of None removes the edge
+    def _set_edge(self, src_nid, dst_nid, length):
+        old_length = self.edge(src_nid, dst_nid)
+        if self.undirected and dst_nid < src_nid:
+            self.edges[dst_nid][src_nid] = length
+        else:
+            self.edges[src_nid][dst_nid] = length
+        if length != None:
+            self._succ[src_nid][dst_nid] = length
+            self._pred[dst_nid][src_nid] = length
+        else:
+            self._succ[src_nid].pop(dst_nid, None)
+            self._pred[dst_nid].pop(src_nid, None)
+        if old_length != length:
+            self._notify("edge", src_nid, dst_nid, old_length, length)
+            # listeners see an undirected edge as a pair of directed ones
+            if self.undirected and src_nid != dst_nid:
+                self._notify("edge", dst_nid, src_nid, old_length, length)
+            
+    # registers a callback that is called as callback(event, *args)
+    # after every change to the graph. events are:
+    #   ("add_node", nid), ("remove_node", nid), ("node_data", nid)
+    #   and ("edge", src_nid, dst_nid, old_length, new_length),
+    # where a length of None means there is no edge
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+        
+    # unregisters a callback added with add_listener
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+        
+    def _notify(self, event, *args):
+        self.version += 1
+        for callback in self._listeners:
+            callback(event, *args)
+            
+    # starts counting the work done by the graph's algorithms, from zero.
+    # counters are:
+    #   "settled": nodes whose minimum distance was determined
+    #   "relaxed": edges followed out of settled nodes
+    #   "queue_pushes" and "queue_pops": priority queue operations
+    #   "select_scans": entries scanned by _d_select to find the next node
+    #   "index_rebuilds" and "reindexed": rebuilds of the node index
+    #       mapping by remove_node, and the entries they rewrote
+    # counting can be nested: the counts of an enclosing call go on
+    # once the inner one stops, and include the inner one's work
+    def start_counting(self):
+        self._outer_counters.append(self.counters)
+        self.counters = dict.fromkeys(["settled", "relaxed", "queue_pushes", "queue_pops",
+                                       "select_scans", "index_rebuilds", "reindexed"], 0)
+        
+    # stops counting, and returns the counts since the matching
+    # start_counting, or None if counting is off
+    def stop_counting(self):
+        if len(self._outer_counters) == 0:
+            return None
+        counters = self.counters
+        self.counters = self._outer_counters.pop()
+        if self.counters != None:
+            for name in counters:
+                self.count(name, counters[name])
+        return counters
+        
+    # adds amount to the named counter, if counting is on
+    def count(self, name, amount=1):
+        if self.counters != None:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            
+    # returns a list of (part, bytes) pairs of the memory taken by the
+    # graph's "metros" (node data), "nodes" and "edges". objects whose
+    # ids are in seen are not counted, and the ids of those that are
+    # counted are added to it. node data that is not loaded yet is
+    # counted as it is, rather than loaded
+    def memory_usage(self, seen=None):
+        # imported here, as it is only needed for profiling
+        from profiling import deep_sizeof
+        
+        if seen == None:
+            seen = set()
+        seen.add(id(self))
+        return [("metros", deep_sizeof([node._data for node in self.nodes], seen)),
+                ("nodes", deep_sizeof([self.nodes, self._node_indices], seen)),
+                ("edges", deep_sizeof([self.edges, self._succ, self._pred], seen))]
         
     # returns whether or not the given nodes are connected by an edge
     def is_edge_between(self, src_nid, dst_nid):
-        return self.edges[src_nid][dst_nid] != None
+        return self.edge(src_nid, dst_nid) != None
     
     # returns the length of the edge between the nodes,
     # or infinity if they are not connected
@@ -139,21 +331,39 @@ class Graph:
         
     # returns a list of ids of the given node's child nodes
     def child_ids(self, node_nid):
-        return filter(lambda dst: self.edges[node_nid][dst] != None, self.edges[node_nid])
+        return list(self._succ[node_nid])
+    
+    # returns a list of ids of the nodes that have an edge to the given node
+    def parent_ids(self, node_nid):
+        return list(self._pred[node_nid])
     
     # returns a list of the given node's child nodes
     def children(self, node_nid):
         return [self.node(nid) for nid in self.child_ids(node_nid)]
         
+    # yields a (src_nid, dst_nid, length) tuple for every edge, in O(E)
+    # time, without scanning the adjacency matrix. edges are grouped by
+    # source in node order, but a node's edges come in no particular order.
+    # an undirected graph yields each edge once, from its smaller id. the
+    # graph must not be changed while iterating
+    def iter_edges(self):
+        for node in self.nodes:
+            children = self._succ[node.nid]
+            for dst_nid in children:
+                if not self.undirected or node.nid <= dst_nid:
+                    yield (node.nid, dst_nid, children[dst_nid])
+        
     # returns the out-degree of the given node
     def out_deg(self, node_nid):
-        return len(self.children(node_nid))
+        return len(self._succ[node_nid])
     
-    def dijkstras(self, src, dst):
+    def dijkstras(self, src, dst, settled=None):
         """
         runs Dijkstra's shortest path algorithm
         :param src: the start node's id
         :param dst: the end node's id
+        :param settled: an optional set to which the ids of all nodes whose
+            minimum distance was determined are added
         :return: a list of node ids representing a minimum path from src to dst
         """
         if not (src in self and dst in self):
@@ -175,12 +385,16 @@ class Graph:
         while node != None:
             # mark this node's distance as known
             dists[node][2] = True
+            if settled != None:
+                settled.add(node)
+            self.count("settled")
             
             # if the destination node's minimum distance is known, we're done
             if node == dst:
                 break
             
             # update this node's children's distances
+            self.count("relaxed", self.out_deg(node))
             for other_node in self.child_ids(node):
                 new_dist = distance + self.distance_between(node, other_node)
                 if new_dist < dists[other_node][0]:
@@ -204,12 +418,202 @@ class Graph:
         # nodes were added in reverse
         return path[::-1]
         
+    def distances_from(self, src, targets=None):
+        """
+        runs Dijkstra's algorithm from src, stopping as soon as the minimum
+        distance of every target is known
+        :param src: the start node's id
+        :param targets: the ids of the nodes of interest, or None for all nodes
+        :return: a tuple of a dictionary from each settled node to its
+            distance from src, and a dictionary from each settled node to
+            its parent on a minimum path from src
+        """
+        dists = dict()
+        parents = {src: None}
+        remaining = set(targets) if targets != None else None
+        best = {src: 0}
+        heap = [(0, src)]
+        pushes = 1
+        pops = relaxed = 0
+        while len(heap) > 0:
+            if remaining != None and len(remaining) == 0:
+                break
+            distance, node = heapq.heappop(heap)
+            pops += 1
+            if node in dists:
+                continue
+            dists[node] = distance
+            if remaining != None:
+                remaining.discard(node)
+                
+            relaxed += len(self._succ[node])
+            for child, length in self._succ[node].items():
+                new_dist = distance + length
+                if child not in dists and new_dist < best.get(child, float("inf")):
+                    best[child] = new_dist
+                    parents[child] = node
+                    heapq.heappush(heap, (new_dist, child))
+                    pushes += 1
+                    
+        self.count_search(len(dists), relaxed, pushes, pops)
+        for node in list(parents):
+            if node not in dists:
+                del parents[node]
+        return (dists, parents)
+    
+    def k_shortest_paths(self, src, dst, k):
+        """
+        runs Yen's algorithm for the k shortest loopless paths. the graph
+        itself is never modified: removed edges and nodes are simulated
+        :param src: the start node's id
+        :param dst: the end node's id
+        :param k: the maximum number of paths to return
+        :return: a list of up to k paths from src to dst, each a list of
+            node ids, in order of increasing length
+        """
+        if not (src in self and dst in self) or k < 1:
+            return []
+        
+        # the shortest path tree into dst is shared by every spur search:
+        # its distances are lower bounds once edges are removed, and its
+        # paths are taken directly whenever they avoid the removed parts
+        dist_to, next_hop = self._distances_to(dst)
+        if dist_to.get(src) == None:
+            return []
+        
+        paths = [self._tree_path(src, next_hop)]
+        candidates = []
+        seen = set([tuple(paths[0])])
+        counter = 0
+        
+        while len(paths) < k:
+            last_path = paths[-1]
+            for i in range(len(last_path) - 1):
+                spur_node = last_path[i]
+                root = last_path[:i + 1]
+                
+                # the spur path may not reuse the root's nodes, nor leave the
+                # spur node the way a previous path with this root did
+                banned_nodes = set(root[:-1])
+                banned_edges = set()
+                for path in paths:
+                    if path[:i + 1] == root:
+                        banned_edges.add(path[i + 1])
+                
+                spur = self._spur_path(spur_node, dst, banned_nodes, banned_edges, dist_to, next_hop)
+                if spur == None:
+                    continue
+                
+                path = root[:-1] + spur
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(candidates, (self.path_length(path), counter, path))
+                    counter += 1
+                    
+            if len(candidates) == 0:
+                break
+            paths.append(heapq.heappop(candidates)[2])
+            
+        return paths
+    
+    def _distances_to(self, dst):
+        """
+        runs Dijkstra's algorithm backwards from dst
+        :return: a tuple of a dictionary from each node that can reach dst to
+            its distance from dst, and a dictionary from each such node to the
+            next node on a minimum path to dst
+        """
+        dist_to = {dst: 0}
+        next_hop = {dst: None}
+        heap = [(0, dst)]
+        settled = relaxed = pushes = pops = 0
+        while len(heap) > 0:
+            distance, node = heapq.heappop(heap)
+            pops += 1
+            if distance > dist_to[node]:
+                continue
+            settled += 1
+            relaxed += len(self._pred[node])
+            for parent, length in self._pred[node].items():
+                new_dist = distance + length
+                if new_dist < dist_to.get(parent, float("inf")):
+                    dist_to[parent] = new_dist
+                    next_hop[parent] = node
+                    heapq.heappush(heap, (new_dist, parent))
+                    pushes += 1
+        self.count_search(settled, relaxed, pushes + 1, pops)
+        return (dist_to, next_hop)
+    
+    def _tree_path(self, src, next_hop):
+        """
+        :return: the path from src that follows next_hop to its end
+        """
+        path = [src]
+        while next_hop[path[-1]] != None:
+            path.append(next_hop[path[-1]])
+        return path
+    
+    def _spur_path(self, src, dst, banned_nodes, banned_first_hops, dist_to, next_hop):
+        """
+        runs A* from src to dst without visiting banned_nodes, and without
+        leaving src towards any of banned_first_hops
+        :param dist_to: distances to dst in the unrestricted graph, used as
+            the heuristic
+        :param next_hop: the shortest path tree matching dist_to
+        :return: a list of node ids representing a minimum path, or None
+        """
+        # the tree path is optimal if nothing on it is banned
+        tree_path = self._tree_path(src, next_hop)
+        if tree_path[1:2] != [] and tree_path[1] not in banned_first_hops and \
+                len(banned_nodes.intersection(tree_path)) == 0:
+            return tree_path
+        
+        best = {src: 0}
+        parents = {src: None}
+        closed = set()
+        heap = [(dist_to[src], src)]
+        pushes = 1
+        pops = relaxed = 0
+        while len(heap) > 0:
+            estimate, node = heapq.heappop(heap)
+            pops += 1
+            if node in closed:
+                continue
+            closed.add(node)
+            if node == dst:
+                break
+            
+            relaxed += len(self._succ[node])
+            for child, length in self._succ[node].items():
+                if child in banned_nodes or child not in dist_to:
+                    continue
+                if node == src and child in banned_first_hops:
+                    continue
+                new_dist = best[node] + length
+                if new_dist < best.get(child, float("inf")):
+                    best[child] = new_dist
+                    parents[child] = node
+                    heapq.heappush(heap, (new_dist + dist_to[child], child))
+                    pushes += 1
+                    
+        self.count_search(len(closed), relaxed, pushes, pops)
+        if dst not in closed:
+            return None
+        
+        path = []
+        cur_node = dst
+        while cur_node != None:
+            path.append(cur_node)
+            cur_node = parents[cur_node]
+        return path[::-1]
+        
     def _d_select(self, dists, parents):
         """
         greedily selects the next node to explore in Dijkstra's algorithm.
         selects the node with the minimum current distance that has been reached, 
         but whose minimum distance is not yet known
         """
+        self.count("select_scans", len(dists))
         tentative_set = filter(lambda node_dist: self._d_is_reached_and_unknown(node_dist, parents), dists.values())
         if len(tentative_set) > 0:
             return min(tentative_set)
@@ -220,4 +624,15 @@ class Graph:
         """
         :return: true if the given node has been reached, but its minimum distance is not known
         """
-        return  (parents[node_dist[1]] != None) and (not node_dist[2])
\ No newline at end of file
+        return  (parents[node_dist[1]] != None) and (not node_dist[2])
+    
+    def count_search(self, settled, relaxed, pushes, pops):
+        """
+        adds the work done by a priority queue search to the counters, if
+        counting is on. searches run outside the graph report through this
+        """
+        if self.counters != None:
+            self.count("settled", settled)
+            self.count("relaxed", relaxed)
+            self.count("queue_pushes", pushes)
+            self.count("queue_pops", pops)
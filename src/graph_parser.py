@@ -1,12 +1,24 @@
 import json
+import numbers
+import os
+import re
 from graph import Graph
+from graph import LazyData
 
-def load(filename, symmetric_routes=True):
+# everything up to the next bracket that is not inside a json string
+_TO_BRACKET = re.compile(r'(?:[^"{}\[\]]+|"(?:[^"\\]|\\.)*")*')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def load(filename, symmetric_routes=True, undirected=False):
     """
     :return: a graph of the json data in the given file
     :param filename: the name of the json file to laod
     :param symmetric_routes: whether the routes in the file should be
-        interpreted as symmetric edges
+        interpreted as symmetric edges. ignored if the file records
+        this itself, under "symmetric routes"
+    :param undirected: whether to store each route once, for both
+        directions. routes listed in both directions are merged. if None,
+        routes are stored once only if every route has an equal route back
     """
     with open(filename) as data:
         map_data = json.load(data)
@@ -15,32 +27,314 @@ def load(filename, symmetric_routes=True):
     for metro in map_data["metros"]:
         nodes[metro["code"]] = metro
     
-    g = Graph(nodes)
+    if undirected == None:
+        undirected = _has_symmetric_routes(map_data, symmetric_routes)
+    g = Graph(nodes, undirected=undirected)
     
-    for route in map_data["routes"]:
-        if symmetric_routes:
-            g.add_symmetric_edge(route["ports"][0], route["ports"][1], route["distance"])
-        else:
-            g.add_edge(route["ports"][0], route["ports"][1], route["distance"])
+    _add_routes(g, map_data, symmetric_routes)
         
     return g
 
+def load_lazy(filename, symmetric_routes=True, undirected=False):
+    """
+    loads the routes in the given file, but only locates each metro in it.
+    a metro's data is parsed from the file the first time it is accessed,
+    apart from its continent, which is known up front
+    :param filename: the name of the json file to laod
+    :param symmetric_routes: whether the routes in the file should be
+        interpreted as symmetric edges. ignored if the file records
+        this itself, under "symmetric routes"
+    :param undirected: whether to store each route once, for both
+        directions. routes listed in both directions are merged. if None,
+        routes are stored once only if every route has an equal route back
+    :return: a tuple of the graph, and a dictionary of the file's other
+        top level fields
+    """
+    metro_file = _MetroFile(filename)
+    text = metro_file.text
+    
+    metro_spans = []
+    fields = _scan_object(text, "metros", metro_spans)
+    
+    nodes = dict()
+    for start, end in metro_spans:
+        # routing partitions the graph by continent, so it is read now
+        known = _top_level_fields(text, start, ["code", "continent"])
+        code = known.pop("code")
+        nodes[code] = LazyData(metro_file.read, start, end)
+        nodes[code].fields.update(known)
+    
+    if undirected == None:
+        undirected = _has_symmetric_routes(fields, symmetric_routes)
+    g = Graph(nodes, undirected=undirected)
+    
+    _add_routes(g, fields, symmetric_routes)
+    del fields["routes"]
+    
+    # the text is only needed to find the metros
+    del metro_file.text
+    return (g, fields)
+
 def load_extra(g, filename, symmetric_routes=True):
     """
     adds the data in the given json file the given graph
-    :param g: the graph to modify
+    :param g: the graph to modify. if it is undirected and the file has
+        one-way routes, it is made directed first
     :param filename: the name of the json file to load
     :param symmetric_routes: whether the routes in the file should be
-        interpreted as symmetric edges
+        interpreted as symmetric edges. ignored if the file records
+        this itself, under "symmetric routes"
     """
     with open(filename) as data:
         map_data = json.load(data)
-        
+    
+    if g.undirected and not _has_symmetric_routes(map_data, symmetric_routes):
+        g.make_directed()
     for metro in map_data["metros"]:
         g.add_node(metro["code"], metro)
     
+    _add_routes(g, map_data, symmetric_routes)
+        
+def _add_routes(g, map_data, symmetric_routes):
+    """
+    adds the routes in the given json data to the given graph
+    """
+    symmetric_routes = map_data.get("symmetric routes", symmetric_routes)
     for route in map_data["routes"]:
         if symmetric_routes:
             g.add_symmetric_edge(route["ports"][0], route["ports"][1], route["distance"])
         else:
-            g.add_edge(route["ports"][0], route["ports"][1], route["distance"])
\ No newline at end of file
+            g.add_edge(route["ports"][0], route["ports"][1], route["distance"])
+
+def _has_symmetric_routes(map_data, symmetric_routes):
+    """
+    :return: whether every route in the given json data will have an equal
+        route back once it is added to a graph, so that storing each route
+        once for both directions loses nothing
+    """
+    if map_data.get("symmetric routes", symmetric_routes):
+        return True
+    return _are_symmetric([(route["ports"][0], route["ports"][1], route["distance"])
+                           for route in map_data["routes"]])
+
+def _are_symmetric(routes):
+    """
+    :return: whether every one of the given (src, dst, distance) routes has
+        an equal route back. a route listed twice keeps its last distance
+    """
+    distances = dict()
+    for src, dst, distance in routes:
+        distances[(src, dst)] = distance
+    for (src, dst), distance in distances.items():
+        if distances.get((dst, src)) != distance:
+            return False
+    return True
+
+def load_many(g, filenames, symmetric_routes=True, processes=None):
+    """
+    adds the data in the given json files to the given graph. the files are
+    parsed in parallel, then merged in the order given: a metro already in
+    the graph is kept, and a route already in the graph takes the distance
+    of the file loaded last, as with load_extra
+    :param g: the graph to modify. if it is undirected and a file has
+        one-way routes, it is made directed first
+    :param filenames: a list of json files. directories can be expanded
+        into the json files they contain with expand_paths
+    :param symmetric_routes: whether the routes in the files should be
+        interpreted as symmetric edges, for files that do not record it
+    :param processes: the number of parsing processes, by default one per core
+    :return: a list of descriptions of the conflicts found while merging
+    """
+    # parse and check everything before touching the graph, so that a
+    # bad file leaves it unchanged
+    # imported here, as it is slow to import and rarely needed
+    import multiprocessing
+    processes = min(processes or multiprocessing.cpu_count(), len(filenames))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            all_data = pool.map(_read_compact, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        all_data = [_read_compact(filename) for filename in filenames]
+    
+    if g.undirected:
+        for metros, routes, symmetric in all_data:
+            if not (symmetric if symmetric != None else symmetric_routes) and not _are_symmetric(routes):
+                g.make_directed()
+    
+    conflicts = []
+    metro_sources = dict()
+    route_sources = dict()
+    for filename, (metros, routes, symmetric) in zip(filenames, all_data):
+        for metro in metros:
+            code = metro["code"]
+            if code in g:
+                if g.node(code).data != metro:
+                    conflicts.append("%s: metro %s differs from the one in %s, which was kept" %
+                                     (filename, code, metro_sources.get(code, "the map")))
+                continue
+            g.add_node(code, metro)
+            metro_sources[code] = filename
+        
+        if symmetric == None:
+            symmetric = symmetric_routes
+        for src, dst, distance in routes:
+            if src not in g or dst not in g:
+                conflicts.append("%s: route %s-%s has an unknown metro, skipped" % (filename, src, dst))
+                continue
+            
+            old_distance = g.edge(src, dst)
+            if old_distance != None and old_distance != distance:
+                conflicts.append("%s: route %s-%s is %s, replacing %s from %s" %
+                                 (filename, src, dst, distance, old_distance,
+                                  route_sources.get((src, dst), "the map")))
+            if symmetric:
+                g.add_symmetric_edge(src, dst, distance)
+                route_sources[(dst, src)] = filename
+            else:
+                g.add_edge(src, dst, distance)
+            route_sources[(src, dst)] = filename
+            
+    return conflicts
+
+def expand_paths(paths):
+    """
+    :return: the given list of file names, with each directory replaced
+        by the json files it contains, in sorted order. hidden files, such
+        as the CLI's saved state, are left out
+    """
+    filenames = []
+    for name in paths:
+        if os.path.isdir(name):
+            filenames.extend([os.path.join(name, entry) for entry in sorted(os.listdir(name))
+                              if entry.endswith(".json") and not entry.startswith(".")])
+        else:
+            filenames.append(name)
+    return filenames
+
+def _read_compact(filename):
+    """
+    parses the given json file, keeping only what load_many needs so
+    that little has to be sent back from a worker process. raises a
+    ValueError if a metro or route is missing a field that merging needs
+    :return: a tuple of the list of metros, the list of routes as
+        (src, dst, distance) tuples, and the recorded route symmetry or None
+    """
+    with open(filename) as data:
+        map_data = json.load(data)
+    
+    for metro in map_data["metros"]:
+        if not isinstance(metro, dict) or not isinstance(metro.get("code"), basestring):
+            raise ValueError("%s: metro %s has no code" % (filename, json.dumps(metro)))
+    routes = []
+    for route in map_data["routes"]:
+        ports = route.get("ports") if isinstance(route, dict) else None
+        if not isinstance(ports, list) or len(ports) != 2 or \
+                not all([isinstance(port, basestring) for port in ports]) or \
+                not isinstance(route.get("distance"), numbers.Number):
+            raise ValueError("%s: route %s needs two ports and a distance" % (filename, json.dumps(route)))
+        routes.append((ports[0], ports[1], route["distance"]))
+    return (map_data["metros"], routes, map_data.get("symmetric routes"))
+
+class _MetroFile:
+    """
+    _MetroFile: a json data file kept open for loading metros on demand.
+    keeping it open means that the metros are read from the loaded file
+    even if it is later replaced, as Map.save does
+    """
+    
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self.text = self._file.read()
+        
+    def read(self, start, end):
+        """
+        :return: the parsed json value at the given byte offsets
+        """
+        self._file.seek(start)
+        return json.loads(self._file.read(end - start))
+
+def _scan_object(text, skipped_key, element_spans):
+    """
+    parses the top level json object in text, except for the array under
+    skipped_key, whose elements are only located
+    :param element_spans: a list to which the (start, end) offsets of each
+        element of the skipped array are appended
+    :return: a dictionary of the parsed keys and values
+    """
+    decoder = json.JSONDecoder()
+    fields = dict()
+    pos = _WHITESPACE.match(text, text.index("{") + 1).end()
+    while text[pos] != "}":
+        key, pos = decoder.raw_decode(text, pos)
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos] != ":":
+            raise ValueError("Expected ':' at offset %s" % pos)
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        
+        if key == skipped_key:
+            pos = _container_end(text, pos, element_spans)
+        else:
+            fields[key], pos = decoder.raw_decode(text, pos)
+        
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos] == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+    return fields
+
+def _top_level_fields(text, start, keys):
+    """
+    parses the values of the given keys of the json object at offset start,
+    without parsing the values of its other keys, or looking inside them
+    :return: a dictionary of the keys found and their values
+    """
+    decoder = json.JSONDecoder()
+    fields = dict()
+    pos = _WHITESPACE.match(text, start + 1).end()
+    while text[pos] != "}":
+        key, pos = decoder.raw_decode(text, pos)
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos] != ":":
+            raise ValueError("Expected ':' at offset %s" % pos)
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        
+        if key in keys:
+            fields[key], pos = decoder.raw_decode(text, pos)
+        elif text[pos] in "[{":
+            pos = _container_end(text, pos, [])
+        else:
+            pos = decoder.raw_decode(text, pos)[1]
+        
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos] == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+    return fields
+
+def _container_end(text, start, element_spans):
+    """
+    :return: the offset just past the json array or object that starts at
+        start. the (start, end) offsets of the objects and arrays directly
+        inside it are appended to element_spans
+    """
+    depth = 0
+    pos = start
+    while True:
+        pos = _TO_BRACKET.match(text, pos).end()
+        if pos == len(text):
+            raise ValueError("Unterminated json value at offset %s" % start)
+        bracket = text[pos]
+        pos += 1
+        
+        if bracket in "[{":
+            depth += 1
+            if depth == 2:
+                element_start = pos - 1
+        else:
+            depth -= 1
+            if depth == 1:
+                element_spans.append((element_start, pos))
+            elif depth == 0:
+                return pos
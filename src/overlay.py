@@ -0,0 +1,266 @@
+import heapq
+
+INF = float("inf")
+
+class PartitionOverlay:
+    """
+    PartitionOverlay: shortest paths through a graph whose nodes are split
+    into partitions, such as continents. the border nodes of the partitions,
+    those with an edge to or from another partition, form a small overlay
+    graph: borders of the same partition are joined by shortcuts, the
+    shortest paths between them within the partition, and borders of
+    different partitions by the edges between them. a query searches
+    within the source partition, across the overlay, and within the
+    destination partition, so any other partition is only ever crossed
+    along its shortcuts
+    """
+
+    def __init__(self, graph, partition_of, on_invalidate=None):
+        """
+        :param graph: the Graph to route through
+        :param partition_of: a function from a node id to its partition
+        :param on_invalidate: a function called with a partition whenever
+            an edit may change the result of a query that touched it
+        """
+        self.graph = graph
+        self.partition_of = partition_of
+        self.on_invalidate = on_invalidate
+
+        # maps each node id to its partition, filled in as needed
+        self._partitions = dict()
+        # maps each partition to the set of its border nodes,
+        # or None until the overlay is first needed
+        self._borders = None
+        # maps each partition to a dictionary from each of its border nodes
+        # to the (dists, parents) of a search from it within the partition.
+        # searches are run as needed, and dropped when the partition changes
+        self._shortcuts = dict()
+        graph.add_listener(self._on_change)
+
+    def partition(self, nid):
+        """
+        :return: the partition of the given node
+        """
+        if nid not in self._partitions:
+            self._partitions[nid] = self.partition_of(nid)
+        return self._partitions[nid]
+
+    def borders(self, part):
+        """
+        :return: a set of the ids of the given partition's border nodes
+        """
+        return set(self._border_sets().get(part, ()))
+
+    def build(self):
+        """
+        computes every shortcut of every partition up front,
+        rather than as queries need them
+        """
+        for part, borders in self._border_sets().items():
+            for border in borders:
+                self._shortcut(part, border)
+
+    def path(self, src, dst, touched=None):
+        """
+        finds a shortest path through the overlay
+        :param src: the start node's id
+        :param dst: the end node's id
+        :param touched: an optional set to which every partition the search
+            entered is added. an edit can only change the result if it is
+            to an edge leaving one of them
+        :return: a list of node ids representing a minimum path from src
+            to dst, or None if there is no such path
+        """
+        if not (src in self.graph and dst in self.graph):
+            return None
+
+        borders = self._border_sets()
+        src_part = self.partition(src)
+        dst_part = self.partition(dst)
+        if touched != None:
+            touched.update([src_part, dst_part])
+
+        src_dists, src_parents = self._search(src, src_part, False)
+        dst_dists, dst_next = self._search(dst, dst_part, True)
+
+        # best is the length of the shortest path found so far, and end the
+        # border where it leaves the overlay, or None if it never enters it
+        best = src_dists.get(dst, INF)
+        end = None
+
+        dists = dict()
+        parents = dict()
+        heap = []
+        for border in borders.get(src_part, ()):
+            if border in src_dists:
+                dists[border] = src_dists[border]
+                parents[border] = None
+                heap.append((src_dists[border], border))
+        heapq.heapify(heap)
+
+        settled = set()
+        pushes = len(heap)
+        pops = relaxed = 0
+        while len(heap) > 0 and heap[0][0] < best:
+            distance, node = heapq.heappop(heap)
+            pops += 1
+            if node in settled:
+                continue
+            settled.add(node)
+            part = self.partition(node)
+            if touched != None:
+                touched.add(part)
+            if part == dst_part and distance + dst_dists.get(node, INF) < best:
+                best = distance + dst_dists[node]
+                end = node
+
+            # cross the node's partition along a shortcut,
+            # or leave it along an edge
+            shortcut_dists = self._shortcut(part, node)[0]
+            edges = [(other, shortcut_dists[other]) for other in borders[part] if other in shortcut_dists]
+            edges.extend([(child, self.graph.edge(node, child)) for child in self.graph.child_ids(node)
+                          if self.partition(child) != part])
+            relaxed += len(edges)
+            for other, length in edges:
+                if distance + length < dists.get(other, INF):
+                    dists[other] = distance + length
+                    parents[other] = node
+                    heapq.heappush(heap, (distance + length, other))
+                    pushes += 1
+        self.graph.count_search(len(settled), relaxed, pushes, pops)
+
+        if best == INF:
+            return None
+        if end == None:
+            return self._trace(src_parents, dst)
+
+        # expand the chain of borders back into the path it stands for
+        borders_path = self._trace(parents, end)
+        path = self._trace(src_parents, borders_path[0])
+        for i in range(1, len(borders_path)):
+            prev, border = borders_path[i - 1], borders_path[i]
+            if self.partition(prev) == self.partition(border):
+                path.extend(self._trace(self._shortcut(self.partition(prev), prev)[1], border)[1:])
+            else:
+                path.append(border)
+        while path[-1] != dst:
+            path.append(dst_next[path[-1]])
+        return path
+
+    def _border_sets(self):
+        """
+        :return: the dictionary from each partition to its border nodes,
+            found first if the overlay has not been needed before
+        """
+        if self._borders == None:
+            self._borders = dict()
+            for nid in self.graph.node_ids():
+                self._update_border(nid)
+        return self._borders
+
+    def _update_border(self, nid):
+        """
+        adds the given node to its partition's borders if it has an edge to
+        or from another partition, and removes it otherwise
+        """
+        part = self.partition(nid)
+        borders = self._borders.setdefault(part, set())
+        neighbours = self.graph.child_ids(nid) + self.graph.parent_ids(nid)
+        if any([self.partition(other) != part for other in neighbours]):
+            borders.add(nid)
+        else:
+            borders.discard(nid)
+
+    def _shortcut(self, part, border):
+        """
+        :return: a tuple of the distances from the given border to the nodes
+            of its partition, and their parents, within the partition
+        """
+        shortcuts = self._shortcuts.setdefault(part, dict())
+        if border not in shortcuts:
+            shortcuts[border] = self._search(border, part, False)
+        return shortcuts[border]
+
+    def _search(self, source, part, reverse):
+        """
+        runs Dijkstra's algorithm from source without leaving its partition,
+        along edges or against them
+        :return: a tuple of a dictionary from each reached node to its
+            distance, and a dictionary from each reached node to its parent,
+            or to the next node towards source if reverse is set
+        """
+        dists = dict()
+        parents = {source: None}
+        best = {source: 0}
+        heap = [(0, source)]
+        pushes = 1
+        pops = relaxed = 0
+        while len(heap) > 0:
+            distance, node = heapq.heappop(heap)
+            pops += 1
+            if node in dists:
+                continue
+            dists[node] = distance
+
+            neighbours = self.graph.parent_ids(node) if reverse else self.graph.child_ids(node)
+            relaxed += len(neighbours)
+            for other in neighbours:
+                if other in dists or self.partition(other) != part:
+                    continue
+                length = self.graph.edge(other, node) if reverse else self.graph.edge(node, other)
+                if distance + length < best.get(other, INF):
+                    best[other] = distance + length
+                    parents[other] = node
+                    heapq.heappush(heap, (distance + length, other))
+                    pushes += 1
+        self.graph.count_search(len(dists), relaxed, pushes, pops)
+        return (dists, parents)
+
+    def _trace(self, parents, node):
+        """
+        :return: the path from the root of the given parent mapping to node
+        """
+        path = []
+        while node != None:
+            path.append(node)
+            node = parents[node]
+        return path[::-1]
+
+    def _invalidate(self, part):
+        if self.on_invalidate != None:
+            self.on_invalidate(part)
+
+    def _on_change(self, event, *args):
+        """
+        graph listener that drops the borders and shortcuts a change affects
+        """
+        # nothing is stored until the overlay is first needed
+        if self._borders == None:
+            return
+
+        if event == "edge":
+            src_part = self.partition(args[0])
+            if src_part == self.partition(args[1]):
+                self._shortcuts.pop(src_part, None)
+            else:
+                self._update_border(args[0])
+                self._update_border(args[1])
+            self._invalidate(src_part)
+        elif event == "node_data":
+            nid = args[0]
+            old_part = self._partitions.pop(nid, None)
+            new_part = self.partition(nid)
+            if old_part != new_part:
+                if old_part in self._borders:
+                    self._borders[old_part].discard(nid)
+                for part in [old_part, new_part]:
+                    if part != None:
+                        self._shortcuts.pop(part, None)
+                        self._invalidate(part)
+                for other in [nid] + self.graph.child_ids(nid) + self.graph.parent_ids(nid):
+                    self._update_border(other)
+        elif event == "remove_node":
+            part = self._partitions.pop(args[0], None)
+            if part in self._borders:
+                self._borders[part].discard(args[0])
+            self._shortcuts.get(part, dict()).pop(args[0], None)
@@ -0,0 +1,37 @@
+import sys
+import types
+
+# objects that belong to the program rather than to its data, and so are
+# never counted nor followed
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType,
+           types.BuiltinFunctionType, getattr(types, "ClassType", type))
+
+def deep_sizeof(roots, seen):
+    """
+    :return: the number of bytes taken by the given objects and every
+        object reachable from them, following containers and instance
+        attributes. objects whose ids are in seen are skipped, and the ids
+        of those that are counted are added to it, so that consecutive
+        calls never count the same object twice
+    :param roots: a list of objects
+    """
+    size = 0
+    stack = list(roots)
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                stack.append(getattr(obj, slot))
+    return size
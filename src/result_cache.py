@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    ResultCache: a bounded least-recently-used cache of query results,
+    where each result records the parts of the graph it was computed from
+    so that it can be dropped as soon as one of them changes
+    """
+
+    # returned by get when a key is not cached
+    MISS = object()
+
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: the maximum number of results to keep
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+        # maps each key to a tuple of (result, dependencies),
+        # from least to most recently used
+        self._entries = OrderedDict()
+        # maps each dependency to the set of keys that depend on it
+        self._dependents = dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        :return: the result cached under key, or ResultCache.MISS
+        """
+        entry = self._entries.pop(key, None)
+        if entry == None:
+            self.misses += 1
+            return self.MISS
+
+        # reinsert to mark as most recently used
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result, dependencies):
+        """
+        caches result under key
+        :param dependencies: the parts of the graph the result was computed
+            from, such as ("node", nid), ("data", nid) or ("out", nid)
+        """
+        if self.capacity <= 0:
+            return
+        self._discard(key)
+        dependencies = frozenset(dependencies)
+        self._entries[key] = (result, dependencies)
+        for dependency in dependencies:
+            self._dependents.setdefault(dependency, set()).add(key)
+
+        while len(self._entries) > self.capacity:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, dependency):
+        """
+        drops every result that depends on the given part of the graph
+        """
+        for key in list(self._dependents.get(dependency, ())):
+            self._discard(key)
+
+    def clear(self):
+        """
+        drops every result
+        """
+        self._entries.clear()
+        self._dependents.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry == None:
+            return
+        for dependency in entry[1]:
+            keys = self._dependents[dependency]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._dependents[dependency]
@@ -0,0 +1,209 @@
+import heapq
+
+INF = float("inf")
+
+class Label:
+    """
+    Label: a partial route from the search origin, as a linked list
+    of labels back to the origin
+    """
+
+    def __init__(self, node, parent, time, cost, hops):
+        self.node = node
+        self.parent = parent
+        self.time = time
+        self.cost = cost
+        self.hops = hops
+        # the set of nodes on the route, which it may not visit again
+        if parent == None:
+            self.visited = frozenset([node])
+        else:
+            self.visited = parent.visited.union([node])
+
+    def path(self):
+        """
+        :return: a list of node ids representing the route of this label
+        """
+        path = []
+        label = self
+        while label != None:
+            path.append(label.node)
+            label = label.parent
+        return path[::-1]
+
+    def visits(self, node):
+        """
+        :return: whether the route of this label passes through the given node
+        """
+        return node in self.visited
+
+    def covers(self, other):
+        """
+        :return: whether this label can continue every way that other can,
+            because other's route visits every node this label's does
+        """
+        return self.visited <= other.visited
+
+
+def fastest_path(graph, src, dst, flight_time, layover_time):
+    """
+    finds the route from src to dst with the smallest total travel time
+    :param graph: the Graph to search
+    :param flight_time: a function from a flight distance to its duration
+    :param layover_time: a function from a node id to the time spent
+        changing planes there
+    :return: a tuple of the route, as a list of node ids, and its total
+        time, or None if there is no route
+    """
+    if not (src in graph and dst in graph):
+        return None
+
+    best = {src: 0}
+    parents = {src: None}
+    settled = set()
+    heap = [(0, src)]
+    while len(heap) > 0:
+        time, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node == dst:
+            break
+
+        # every flight out of an intermediate city waits for a layover first
+        departure = time
+        if node != src:
+            departure += layover_time(node)
+
+        for child in graph.child_ids(node):
+            new_time = departure + flight_time(graph.edge(node, child))
+            if new_time < best.get(child, INF):
+                best[child] = new_time
+                parents[child] = node
+                heapq.heappush(heap, (new_time, child))
+
+    if dst not in settled:
+        return None
+
+    path = []
+    cur_node = dst
+    while cur_node != None:
+        path.append(cur_node)
+        cur_node = parents[cur_node]
+    return (path[::-1], best[dst])
+
+
+def cheapest_path(graph, src, dst, leg_rates):
+    """
+    finds the loopless route from src to dst with the smallest total cost,
+    where the i-th flight of a route costs leg_rates[i] per km and flights
+    beyond the end of leg_rates are free
+    :param graph: the Graph to search
+    :param leg_rates: a list of prices per km for each flight of a route
+    :return: a tuple of the route, as a list of node ids, and its total
+        cost, or None if there is no route
+    """
+    if not (src in graph and dst in graph):
+        return None
+
+    free_after = len(leg_rates)
+
+    # a label with more flights behind it pays less for the next ones,
+    # so at each node keep every label not beaten on both cost and flights.
+    # routes are loopless, so a label only beats another whose route
+    # visits every node its own does, as it can then go wherever the
+    # other can
+    settled = dict()
+    heap = [(0.0, 0, 0, Label(src, None, 0, 0.0, 0))]
+    counter = 1
+    while len(heap) > 0:
+        cost, hops, _, label = heapq.heappop(heap)
+        node = label.node
+        if node == dst:
+            return (label.path(), cost)
+
+        hops = min(hops, free_after)
+        known = settled.setdefault(node, [])
+        if any(other_hops >= hops and other.covers(label) for other_hops, other in known):
+            # a label at least as cheap, with at least as many flights, was
+            # already expanded
+            continue
+        known.append((hops, label))
+
+        rate = leg_rates[label.hops] if label.hops < free_after else 0
+        for child in graph.child_ids(node):
+            if label.visits(child):
+                continue
+            new_cost = cost + rate * graph.edge(node, child)
+            child_label = Label(child, label, 0, new_cost, label.hops + 1)
+            heapq.heappush(heap, (new_cost, child_label.hops, counter, child_label))
+            counter += 1
+
+    return None
+
+
+def pareto_paths(graph, src, dst, flight_time, layover_time, leg_rates, max_hops=None):
+    """
+    finds every loopless route from src to dst that is not beaten on all
+    of total time, total cost and number of flights by another route
+    :param graph: the Graph to search
+    :param flight_time: a function from a flight distance to its duration
+    :param layover_time: a function from a node id to the time spent
+        changing planes there
+    :param leg_rates: a list of prices per km for each flight of a route
+    :param max_hops: the maximum number of flights in a route, if any
+    :return: a list of (route, time, cost) tuples, ordered by time
+    """
+    if not (src in graph and dst in graph):
+        return []
+
+    free_after = len(leg_rates)
+
+    def dominates(a, b):
+        # the cost of the next flights depends on the number of flights
+        # taken so far, unless they are all free already, and a loopless
+        # route can only continue where it has not been yet
+        if a.time > b.time or a.cost > b.cost or not a.covers(b):
+            return False
+        return a.hops == b.hops or free_after <= a.hops <= b.hops
+
+    results = []
+    settled = dict()
+    heap = [(0, 0.0, 0, 0, Label(src, None, 0, 0.0, 0))]
+    counter = 1
+    while len(heap) > 0:
+        label = heapq.heappop(heap)[-1]
+        node = label.node
+
+        if node == dst:
+            if not any(r.time <= label.time and r.cost <= label.cost and r.hops <= label.hops for r in results):
+                results.append(label)
+            continue
+
+        # skip labels that a known result beats even after their next flight
+        if any(r.time <= label.time and r.cost <= label.cost and r.hops <= label.hops + 1 for r in results):
+            continue
+
+        known = settled.setdefault(node, [])
+        if any(dominates(other, label) for other in known):
+            continue
+        known.append(label)
+
+        if max_hops != None and label.hops >= max_hops:
+            continue
+
+        departure = label.time
+        if node != src:
+            departure += layover_time(node)
+        rate = leg_rates[label.hops] if label.hops < free_after else 0
+
+        for child in graph.child_ids(node):
+            if label.visits(child):
+                continue
+            length = graph.edge(node, child)
+            child_label = Label(child, label, departure + flight_time(length),
+                                label.cost + rate * length, label.hops + 1)
+            heapq.heappush(heap, (child_label.time, child_label.cost, child_label.hops, counter, child_label))
+            counter += 1
+
+    return [(label.path(), label.time, label.cost) for label in results]
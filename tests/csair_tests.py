@@ -1,7 +1,12 @@
 import unittest
 import graph_parser
+import exporters
 from csair_map import Map
 import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
 
 class CSAirMapTest(unittest.TestCase):
     
@@ -20,6 +25,13 @@ class CSAirMapTest(unittest.TestCase):
         # incorrect city
         self.assertEqual(self.airmap.city_info('FAKE'), {'ERROR': 'FAKE not a valid code'})
         
+    def test_lazy_map(self):
+        airmap = Map("../data/test_data.json", lazy=True)
+        self.assertEqual(airmap.shortest_path("MEX", "SCL"), self.airmap.shortest_path("MEX", "SCL"))
+        self.assertFalse(any([node.is_loaded() for node in airmap.graph.nodes]))
+        self.assertEqual(airmap.city_info("MEX"), self.airmap.city_info("MEX"))
+        self.assertEqual(airmap.city_list(), self.airmap.city_list())
+        
     def test_longest_flight(self):
         self.assertEqual(self.airmap.longest_flight(), (u'Mexico City', u'Lima', 4231))
         
@@ -46,9 +58,103 @@ class CSAirMapTest(unittest.TestCase):
         self.assertEqual(self.airmap.hubs(), [(u'Lima', 2), (u'Mexico City', 1), (u'Santiago', 1)])
         # limit of 1
         self.assertEqual(self.airmap.hubs(1), [(u'Lima', 2)])
+        self.assertEqual(self.airmap.hubs("1"), [(u'Lima', 2)])
+        self.assertEqual(self.airmap.hubs("abc"), 'Error: abc is not a valid number of hubs')
+        self.assertEqual(self.airmap.hubs(by="degree"), 'Error: degree is not a valid way to rank hubs')
+    
+    def test_hubs_by_betweenness(self):
+        self.assertEqual(self.airmap.hubs(by="betweenness"), [(u'Lima', 2.0), (u'Mexico City', 0.0), (u'Santiago', 0.0)])
+        scores = self.airmap.betweenness()
+        self.assertIs(self.airmap.betweenness(), scores)
+        
+        self.airmap.add_route("MEX", "SCL", 100)
+        self.assertEqual(self.airmap.hubs(1, by="betweenness"), [(u'Lima', 1.0)])
+        
+        self.assertEqual(self.airmap.hubs(1, "betweenness", "2"), self.airmap.hubs(1, "betweenness", 2))
+        for samples in [0, -1, "abc"]:
+            self.assertEqual(self.airmap.hubs(by="betweenness", samples=samples),
+                             'Error: %s is not a valid number of samples' % samples)
+            self.assertEqual(self.airmap.betweenness(samples), 'Error: %s is not a valid number of samples' % samples)
     
-    def test_visualizer_url(self):
-        self.assertEqual(self.airmap.visualizer_url(), 'http://www.gcmap.com/mapui?P=SCL-LIM,MEX-LIM,LIM-SCL,LIM-MEX')
+    def test_network_analytics(self):
+        self.assertEqual(self.airmap.diameter(), 6684)
+        self.assertEqual(self.airmap.radius(), (4231, [u'Lima']))
+        self.assertEqual(self.airmap.eccentricity("SCL"), 6684)
+        self.assertEqual(self.airmap.eccentricity("FAKE"), 'Error: FAKE not a valid code')
+        self.assertEqual(self.airmap.diameter(samples=1), 4231)
+        self.assertEqual(self.airmap.diameter(samples=2), 6684)
+        self.assertEqual(self.airmap.diameter(samples="2"), 6684)
+        for samples in [0, -1, "abc"]:
+            error = 'Error: %s is not a valid number of samples' % samples
+            self.assertEqual(self.airmap.diameter(samples), error)
+            self.assertEqual(self.airmap.radius(samples), error)
+            self.assertEqual(self.airmap.eccentricity("SCL", samples), error)
+        
+        # edits invalidate the stored results
+        self.airmap.add_route("MEX", "SCL", 100)
+        self.assertEqual(self.airmap.diameter(), 6684)
+        self.assertEqual(self.airmap.eccentricity("MEX"), 2553)
+        self.airmap.add_route("SCL", "MEX", 100)
+        self.airmap.remove_route("MEX", "LIM")
+        self.assertEqual(self.airmap.diameter(), 2553)
+        
+    def test_profile(self):
+        result, counters, seconds = self.airmap.profile(self.airmap.shortest_path, "SCL", "LIM")
+        self.assertEqual(result, self.airmap.shortest_path("SCL", "LIM"))
+        self.assertEqual(counters["settled"], 2)
+        self.assertEqual(counters["cache_misses"], 2)
+        self.assertTrue(seconds >= 0)
+        self.assertIsNone(self.airmap.graph.counters)
+        
+        # a cached result takes no searching
+        result, counters, seconds = self.airmap.profile(self.airmap.shortest_path, "SCL", "LIM")
+        self.assertEqual(counters["settled"], 0)
+        self.assertEqual(counters["cache_hits"], 1)
+        
+        # profiling a profile counts the inner query's work in both
+        self.airmap.cache.clear()
+        (result, inner, inner_seconds), counters, seconds = self.airmap.profile(
+            self.airmap.profile, self.airmap.shortest_path, "SCL", "LIM")
+        self.assertEqual(inner["settled"], 2)
+        self.assertEqual(counters["settled"], 2)
+        self.assertEqual(counters["cache_misses"], 2)
+        self.assertIsNone(self.airmap.graph.counters)
+        
+        usage = self.airmap.memory_usage()
+        self.assertEqual([part for part, size in usage], ["metros", "nodes", "edges", "caches", "total"])
+        self.assertEqual(usage[-1][1], sum([size for part, size in usage[:-1]]))
+        self.assertTrue(usage[3][1] > 0)
+        
+    def test_shortest_path_between_continents(self):
+        route = self.airmap.shortest_path("SCL", "MEX")
+        self.assertTrue(route.startswith("Shortest route: SCL-LIM-MEX"))
+        self.assertEqual(self.airmap.overlay.borders("South America"), set(["LIM"]))
+        
+        # a precomputed overlay routes the same way
+        airmap = Map("../data/map_data.json", precompute_overlay=True)
+        lazy_airmap = Map("../data/map_data.json")
+        for code in airmap.graph.node_ids():
+            continent = airmap.graph.node(code).data["continent"]
+            self.assertEqual(code in airmap.overlay._shortcuts.get(continent, dict()),
+                             code in airmap.overlay.borders(continent))
+        for src, dst in [("SCL", "TYO"), ("LON", "SYD"), ("NYC", "CAI")]:
+            self.assertEqual(airmap.shortest_path(src, dst), lazy_airmap.shortest_path(src, dst))
+        
+        # routes within a continent the search never entered keep the result
+        self.airmap.graph.add_node("LHR", {"code": "LHR", "continent": "Europe"})
+        self.airmap.graph.add_node("CDG", {"code": "CDG", "continent": "Europe"})
+        self.airmap.add_route("LHR", "CDG", 344)
+        self.assertTrue(("shortest_path", "SCL", "MEX") in self.airmap.cache)
+        self.airmap.add_route("LIM", "LHR", 10000)
+        self.assertFalse(("shortest_path", "SCL", "MEX") in self.airmap.cache)
+        self.assertTrue(self.airmap.shortest_path("SCL", "MEX").startswith("Shortest route: SCL-LIM-MEX"))
+        
+    def test_visualizer_urls(self):
+        urls = self.airmap.visualizer_urls()
+        self.assertEqual(len(urls), 1)
+        self.assertTrue(urls[0].startswith(exporters.GCMAP_URL))
+        self.assertEqual(sorted(urls[0][len(exporters.GCMAP_URL):].split(",")),
+                         ["LIM-MEX", "LIM-SCL", "MEX-LIM", "SCL-LIM"])
         
     def test_remove_city(self):
         self.assertTrue("SCL" in self.airmap.graph)
@@ -88,11 +194,205 @@ class CSAirMapTest(unittest.TestCase):
         self.assertTrue(self.airmap.graph.is_edge_between("MEX", "SCL"))
         self.assertEqual(self.airmap.graph.distance_between("MEX", "SCL"), 100)
         
+    def test_load_extra(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name, metros, routes in [
+                ("a.json", [{"code": "AAA", "name": "A"}], [{"ports": ["AAA", "MEX"], "distance": 10}]),
+                ("b.json", [{"code": "AAA", "name": "B"}, {"code": "BBB", "name": "B"}],
+                    [{"ports": ["MEX", "AAA"], "distance": 20}, {"ports": ["BBB", "CCC"], "distance": 5}]),
+                ("notes.txt", [], []),
+                (".saved_state.json", [{"code": "DDD", "name": "D"}], [])
+            ]:
+                with open(os.path.join(directory, name), 'w') as data_file:
+                    json.dump({"metros": metros, "routes": routes}, data_file)
+            
+            a = os.path.join(directory, "a.json")
+            b = os.path.join(directory, "b.json")
+            self.assertEqual(self.airmap.load_extra(directory),
+                             'Loaded %s, %s\n3 conflicts:\n\t' % (a, b) +
+                             '%s: metro AAA differs from the one in %s, which was kept\n\t' % (b, a) +
+                             '%s: route MEX-AAA is 20, replacing 10 from %s\n\t' % (b, a) +
+                             '%s: route BBB-CCC has an unknown metro, skipped' % b)
+            self.assertEqual(self.airmap.graph.node("AAA").data["name"], "A")
+            self.assertEqual(self.airmap.graph.distance_between("AAA", "MEX"), 20)
+            self.assertTrue("BBB" in self.airmap.graph)
+            
+            self.assertEqual(self.airmap.load_extra(a), 'Loaded %s\n1 conflicts:\n\t' % a +
+                             '%s: route AAA-MEX is 10, replacing 20 from the map' % a)
+            self.assertEqual(self.airmap.load_extra("FAKE.json", a), 'Error: Could not load FAKE.json, %s' % a)
+            self.assertFalse("DDD" in self.airmap.graph)
+            
+            # a file with a metro missing its code is not merged at all
+            c = os.path.join(directory, "c.json")
+            with open(c, 'w') as data_file:
+                json.dump({"metros": [{"code": "EEE"}, {"name": "F"}], "routes": []}, data_file)
+            self.assertEqual(self.airmap.load_extra(c), 'Error: Could not load %s' % c)
+            self.assertFalse("EEE" in self.airmap.graph)
+            with open(c, 'w') as data_file:
+                json.dump({"metros": [{"code": "EEE"}], "routes": [{"ports": ["EEE"], "distance": 1}]}, data_file)
+            self.assertEqual(self.airmap.load_extra(c), 'Error: Could not load %s' % c)
+            self.assertFalse("EEE" in self.airmap.graph)
+        finally:
+            shutil.rmtree(directory)
+        
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "saved.json")
+            for compact in [False, True]:
+                self.assertEqual(self.airmap.save(filename, compact), 'Saved to %s' % filename)
+                saved = Map(filename, symmetric_routes=False)
+                self.assertEqual(saved.graph.edges, self.airmap.graph.edges)
+                self.assertEqual(saved.city_info('MEX'), self.airmap.city_info('MEX'))
+            
+            # a failed save leaves the previous file in place
+            self.airmap.graph.node("MEX").data["population"] = object()
+            self.assertEqual(self.airmap.save(filename), 'Error: Could not save to %s' % filename)
+            self.assertEqual(Map(filename, symmetric_routes=False).graph.edges, saved.graph.edges)
+            self.assertEqual(os.listdir(directory), ["saved.json"])
+        finally:
+            shutil.rmtree(directory)
+            
+    def test_export(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "routes")
+            self.assertEqual(self.airmap.export(filename), 'Exported to %s' % filename)
+            with open(filename) as export_file:
+                lines = export_file.read().splitlines()
+            self.assertEqual(lines[0], "src,dst,distance")
+            self.assertEqual(sorted(lines[1:]), ["LIM,MEX,4231", "LIM,SCL,2453", "MEX,LIM,4231", "SCL,LIM,2453"])
+            
+            self.assertEqual(self.airmap.export(filename, "geojson"), 'Exported to %s' % filename)
+            with open(filename) as export_file:
+                features = json.load(export_file)["features"]
+            self.assertEqual(len(features), 7)
+            self.assertEqual(features[0]["geometry"]["coordinates"], [-71, -33])
+            self.assertEqual(features[3]["properties"], {"ports": ["SCL", "LIM"], "distance": 2453})
+            
+            self.assertEqual(self.airmap.export(filename, "gcmap"), 'Exported to %s' % filename)
+            with open(filename) as export_file:
+                self.assertEqual(export_file.read().splitlines(), self.airmap.visualizer_urls())
+            self.assertEqual(self.airmap.export(filename, "png"), 'Error: png is not a valid export format')
+        finally:
+            shutil.rmtree(directory)
+            
+    def test_gcmap_chunks(self):
+        routes = [("SCL", "LIM", 2453), ("MEX", "LIM", 4231), ("LIM", "SCL", 2453)]
+        out = StringIO()
+        exporters.write_gcmap_urls(out, routes, len(exporters.GCMAP_URL) + 15)
+        self.assertEqual(out.getvalue().splitlines(), [exporters.GCMAP_URL + "SCL-LIM,MEX-LIM",
+                                                       exporters.GCMAP_URL + "LIM-SCL"])
+        
+    def test_save_undirected(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "saved.json")
+            airmap = Map("../data/test_data.json", undirected=True)
+            self.assertEqual(airmap.save(filename), 'Saved to %s' % filename)
+            with open(filename) as saved_file:
+                saved = json.load(saved_file)
+            self.assertTrue(saved["symmetric routes"])
+            self.assertEqual(len(saved["routes"]), 2)
+            
+            # the recorded symmetry wins over the caller's setting
+            for undirected in [False, True]:
+                loaded = Map(filename, symmetric_routes=False, undirected=undirected)
+                self.assertTrue(loaded.graph.is_edge_between("MEX", "LIM"))
+                self.assertTrue(loaded.graph.is_edge_between("LIM", "MEX"))
+            self.assertEqual(loaded.hubs(), self.airmap.hubs())
+            
+            # directed maps record that their routes are not symmetric
+            self.airmap.save(filename)
+            self.assertFalse(Map(filename, symmetric_routes=True).graph.is_edge_between("MEX", "SCL"))
+            self.airmap.remove_route("MEX", "LIM")
+            self.airmap.save(filename)
+            self.assertFalse(Map(filename, symmetric_routes=True).graph.is_edge_between("MEX", "LIM"))
+        finally:
+            shutil.rmtree(directory)
+        
+    def test_edit_undirected(self):
+        airmap = Map("../data/test_data.json", undirected=None)
+        self.assertTrue(airmap.graph.undirected)
+        
+        # a one-way edit leaves the route back as it was
+        self.assertEqual(airmap.add_route("MEX", "LIM", 4231), 'Added MEX-LIM')
+        self.assertTrue(airmap.graph.undirected)
+        self.assertEqual(airmap.add_route("MEX", "LIM", 4000), 'Added MEX-LIM')
+        self.assertFalse(airmap.graph.undirected)
+        self.assertEqual(airmap.graph.edge("LIM", "MEX"), 4231)
+        self.assertEqual(airmap.remove_route("LIM", "SCL"), 'Removed LIM-SCL')
+        self.assertTrue(airmap.graph.is_edge_between("SCL", "LIM"))
+        
     def test_route_info(self):
         self.assertEqual(self.airmap.route_info(["MEX", "LIM", "SCL"]), '======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2216.75\nTotal time: 11.81 hours\n')
         
     def test_shortest_path(self):
         self.assertEqual(self.airmap.shortest_path("MEX", "SCL"), 'Shortest route: MEX-LIM-SCL\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2216.75\nTotal time: 11.81 hours\n')
+        
+    def test_distance_matrix(self):
+        matrix = self.airmap.distance_matrix(["MEX", "SCL"], ["SCL", "LIM", "MEX"])
+        self.assertEqual([list(row) for row in matrix], [[6684, 4231, 0], [0, 2453, 6684]])
+        
+        self.airmap.remove_route("LIM", "MEX")
+        matrix, routes = self.airmap.distance_matrix(["SCL"], ["MEX", "LIM"], paths=True)
+        self.assertEqual([list(row) for row in matrix], [[float("inf"), 2453]])
+        self.assertEqual(routes, [[None, ["SCL", "LIM"]]])
+        
+        self.assertEqual(self.airmap.distance_matrix(["MEX"], ["FAKE"]), 'Error: FAKE not a valid code')
+        
+    def test_k_shortest_paths(self):
+        self.airmap.add_route("MEX", "SCL", 7000)
+        self.assertEqual(self.airmap.k_shortest_paths("MEX", "SCL", 2), 'Route 1: MEX-LIM-SCL\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2216.75\nTotal time: 11.81 hours\n\nRoute 2: MEX-SCL\n\n======== Route info ========\nTotal distance: 7000 km\nTotal cost: $2450.0\nTotal time: 9.87 hours\n')
+        self.assertEqual(self.airmap.k_shortest_paths("SCL", "MEX"), 'Route 1: SCL-LIM-MEX\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2127.85\nTotal time: 11.81 hours\n')
+        
+    def test_fastest_path(self):
+        self.assertEqual(self.airmap.fastest_path("SCL", "MEX"), 'Fastest route: SCL-LIM-MEX\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2127.85\nTotal time: 11.81 hours\n')
+        self.airmap.add_route("SCL", "MEX", 7000)
+        self.assertEqual(self.airmap.fastest_path("SCL", "MEX"), 'Fastest route: SCL-MEX\n\n======== Route info ========\nTotal distance: 7000 km\nTotal cost: $2450.0\nTotal time: 9.87 hours\n')
+        self.assertEqual(self.airmap.fastest_path("SCL", "FAKE"), 'Error: Could not find path between the given cities')
+        
+    def test_cheapest_path(self):
+        self.airmap.add_route("SCL", "MEX", 6500)
+        self.assertEqual(self.airmap.cheapest_path("SCL", "MEX"), 'Cheapest route: SCL-LIM-MEX\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2127.85\nTotal time: 11.81 hours\n')
+        
+    def test_pareto_paths(self):
+        self.airmap.add_route("SCL", "MEX", 6500)
+        self.assertEqual(self.airmap.pareto_paths("SCL", "MEX"), '======== Route options ========\nSCL-MEX: 9.2 hours, $2275.0, 1 flights\nSCL-LIM-MEX: 11.81 hours, $2127.85, 2 flights\n')
+        self.assertEqual(self.airmap.pareto_paths("SCL", "MEX", max_hops=1), '======== Route options ========\nSCL-MEX: 9.2 hours, $2275.0, 1 flights\n')
+        
+    def test_result_cache(self):
+        self.airmap.city_info('MEX')
+        self.airmap.city_info('MEX')['name'] = 'Changed'
+        self.assertEqual(self.airmap.city_info('MEX', 'name'), {'name': u'Mexico City'})
+        self.assertEqual((self.airmap.cache.hits, self.airmap.cache.misses), (1, 2))
+        
+        # mutations drop exactly the affected results
+        self.airmap.route_info(["SCL", "LIM"])
+        self.airmap.edit_city("LIM", "name", "Lima Metro")
+        self.assertEqual(self.airmap.city_info('MEX')['destinations'], u'\n\tLima Metro (4231)')
+        self.assertTrue(("route_info", ("SCL", "LIM")) in self.airmap.cache)
+        
+        self.assertEqual(self.airmap.shortest_path("MEX", "SCL")[:35], 'Shortest route: MEX-LIM-SCL\n\n======')
+        self.airmap.add_route("MEX", "SCL", 10)
+        self.assertEqual(self.airmap.shortest_path("MEX", "SCL")[:31], 'Shortest route: MEX-SCL\n\n======')
+        self.assertTrue(("route_info", ("SCL", "LIM")) in self.airmap.cache)
+        self.airmap.remove_route("SCL", "LIM")
+        self.assertEqual(self.airmap.route_info(["SCL", "LIM"]), 'Error: Given route is invalid')
+        
+        # an unknown city becomes known
+        self.assertEqual(self.airmap.city_info('AAA'), {'ERROR': 'AAA not a valid code'})
+        self.airmap.graph.add_node("AAA", {"name": "AAA", "coordinates": {"N": 1, "E": 1}})
+        self.assertEqual(self.airmap.city_info('AAA', 'name'), {'name': 'AAA'})
+        self.assertTrue(self.airmap.cache_stats().startswith('======== Cache stats ========\nCached results: '))
+        
+    def test_track(self):
+        self.assertEqual(self.airmap.track(["FAKE"]), 'Error: FAKE not a valid code')
+        self.assertEqual(self.airmap.track(["MEX"]), 'Tracking MEX')
+        self.assertEqual(self.airmap.shortest_path("MEX", "SCL"), 'Shortest route: MEX-LIM-SCL\n\n======== Route info ========\nTotal distance: 6684 km\nTotal cost: $2216.75\nTotal time: 11.81 hours\n')
+        self.airmap.remove_route("LIM", "SCL")
+        self.assertEqual(self.airmap.shortest_path("MEX", "SCL"), 'Error: Could not find path between the given cities')
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -2,6 +2,16 @@ import unittest
 from graph import Graph
 from graph import Node
 import graph_parser
+import random
+import json
+import os
+import shutil
+import tempfile
+from dynamic_sssp import DynamicShortestPaths
+from overlay import PartitionOverlay
+import centrality
+import analytics
+import route_search
 
 class GraphTest(unittest.TestCase):
     
@@ -45,6 +55,40 @@ class GraphTest(unittest.TestCase):
         self.assertEqual(len(g.children("C")), 1)
         self.assertFalse(g.is_edge_between("A", "C"))
         
+    def test_undirected_graph(self):
+        g = Graph({"A": 1, "B": 2, "C": 3}, undirected=True)
+        # only the upper triangle of the matrix is stored
+        self.assertEqual(sum([len(row) for row in g.edges.values()]), 6)
+        
+        g.add_edge("B", "A", 5)
+        self.assertEqual(g.edges["A"]["B"], 5)
+        self.assertEqual(g.distance_between("A", "B"), 5)
+        self.assertEqual(g.distance_between("B", "A"), 5)
+        self.assertEqual(set(g.child_ids("A")), set(["B"]))
+        self.assertEqual(set(g.parent_ids("A")), set(["B"]))
+        
+        g.add_node("AA", 4)
+        g.add_edge("C", "AA", 1)
+        self.assertEqual(g.dijkstras("B", "C"), None)
+        g.add_edge("A", "AA", 1)
+        self.assertEqual(g.dijkstras("C", "B"), ["C", "AA", "A", "B"])
+        
+        g.remove_edge("A", "B")
+        self.assertFalse(g.is_edge_between("B", "A"))
+        g.remove_node("AA")
+        self.assertEqual(sum([len(row) for row in g.edges.values()]), 6)
+        self.assertEqual(g.out_deg("C"), 0)
+        
+        # once directed, the two directions can differ
+        g.add_edge("B", "C", 2)
+        g.make_directed()
+        self.assertFalse(g.undirected)
+        self.assertEqual(sum([len(row) for row in g.edges.values()]), 9)
+        self.assertEqual(g.edge("C", "B"), 2)
+        g.add_edge("B", "C", 7)
+        self.assertEqual(g.edge("C", "B"), 2)
+        self.assertEqual(set(g.parent_ids("C")), set(["B"]))
+        
     def test_remove_node(self):
         g = self.big_graph
         self.assertTrue("A" in g)
@@ -63,6 +107,18 @@ class GraphTest(unittest.TestCase):
         self.assertEqual(g.path_length(["D"]), 0)
         self.assertEqual(g.path_length(["A", "C", "E", "D"]), 14)
         
+    def test_iter_edges(self):
+        g = Graph({"A": 1, "B": 2, "C": 3})
+        g.add_edge("C", "A", 2)
+        g.add_edge("A", "C", 3)
+        g.add_edge("A", "B", 1)
+        self.assertEqual(sorted(g.iter_edges()), [("A", "B", 1), ("A", "C", 3), ("C", "A", 2)])
+        
+        g = Graph({"A": 1, "B": 2, "C": 3}, undirected=True)
+        g.add_edge("C", "A", 2)
+        g.add_edge("B", "C", 4)
+        self.assertEqual(sorted(g.iter_edges()), [("A", "C", 2), ("B", "C", 4)])
+        
     def test_dijkstras(self):
         g = self.big_graph
         self.assertEqual(g.dijkstras("A", "E"), ["A", "C", "B", "E"])
@@ -79,6 +135,297 @@ class GraphTest(unittest.TestCase):
         # test when path does not exist
         self.assertIsNone(g.dijkstras("D", "A"))
         
+    def test_distances_from(self):
+        g = self.big_graph
+        dists, parents = g.distances_from("A")
+        self.assertEqual(dists, {"A": 0, "B": 3, "C": 2, "D": 6, "E": 4})
+        self.assertEqual(parents["E"], "B")
+        
+        # the search stops once every target is settled
+        dists, parents = g.distances_from("A", ["B"])
+        self.assertEqual(dists["B"], 3)
+        self.assertNotIn("D", dists)
+        self.assertEqual(set(parents), set(dists))
+        
+    def test_k_shortest_paths(self):
+        g = self.big_graph
+        edges = dict((nid, dict(row)) for nid, row in g.edges.items())
+        self.assertEqual(g.k_shortest_paths("A", "D", 4), [["A", "C", "B", "D"], ["A", "B", "D"], ["A", "C", "D"], ["A", "C", "B", "E", "D"]])
+        self.assertEqual(len(g.k_shortest_paths("A", "D", 100)), 6)
+        self.assertEqual(g.k_shortest_paths("D", "A", 3), [])
+        self.assertEqual(g.k_shortest_paths("A", "A", 3), [["A"]])
+        # the graph is left untouched
+        self.assertEqual(g.edges, edges)
+        
+    def test_listeners(self):
+        g = self.big_graph
+        events = []
+        g.add_listener(lambda *event: events.append(event))
+        version = g.version
+        
+        g.add_edge("D", "A", 2)
+        g.add_edge("D", "A", 2)
+        g.remove_node("E")
+        self.assertEqual(events[0], ("edge", "D", "A", None, 2))
+        self.assertEqual(set(events[1:4]), set([("edge", "E", "D", 7, None),
+                                                ("edge", "B", "E", 1, None),
+                                                ("edge", "C", "E", 5, None)]))
+        self.assertEqual(events[4], ("remove_node", "E"))
+        self.assertEqual(g.version, version + 5)
+        self.assertEqual(set(g.parent_ids("D")), set(["B", "C"]))
+        
+    def test_counters(self):
+        g = self.big_graph
+        self.assertIsNone(g.counters)
+        g.dijkstras("A", "D")
+        self.assertIsNone(g.counters)
+        
+        g.start_counting()
+        g.dijkstras("A", "D")
+        self.assertEqual(g.counters["settled"], 5)
+        self.assertEqual(g.counters["relaxed"], 8)
+        self.assertEqual(g.counters["select_scans"], 20)
+        g.distances_from("A")
+        self.assertEqual(g.counters["settled"], 10)
+        self.assertEqual(g.counters["queue_pops"], g.counters["queue_pushes"])
+        g.remove_node("E")
+        self.assertEqual(g.counters["index_rebuilds"], 1)
+        self.assertEqual(g.counters["reindexed"], 4)
+        counters = g.stop_counting()
+        self.assertEqual(counters["settled"], 10)
+        self.assertIsNone(g.counters)
+        self.assertIsNone(g.stop_counting())
+        
+        # nested counts are added to the enclosing ones
+        g.start_counting()
+        g.dijkstras("A", "B")
+        g.start_counting()
+        g.dijkstras("A", "B")
+        self.assertEqual(g.stop_counting()["settled"], 3)
+        self.assertEqual(g.counters["settled"], 6)
+        self.assertEqual(g.stop_counting()["settled"], 6)
+        self.assertIsNone(g.counters)
+        
+    def test_memory_usage(self):
+        usage = dict(self.big_graph.memory_usage())
+        self.assertEqual(sorted(usage), ["edges", "metros", "nodes"])
+        self.assertTrue(usage["edges"] > usage["metros"] > 0)
+        
+class CentralityTest(unittest.TestCase):
+    
+    def test_betweenness(self):
+        g = Graph(dict((nid, None) for nid in "ABCDE"))
+        for src, dst in ["AB", "AC", "BD", "CD", "DE"]:
+            g.add_symmetric_edge(src, dst, 1)
+        expected = {"A": 1.0, "B": 2.0, "C": 2.0, "D": 7.0, "E": 0.0}
+        self.assertEqual(centrality.betweenness(g), expected)
+        self.assertEqual(centrality.betweenness(g, processes=2), expected)
+        
+        # sampling every node is exact
+        self.assertEqual(centrality.betweenness(g, samples=5), expected)
+        estimate = centrality.betweenness(g, samples=2, seed=1)
+        self.assertEqual(set(estimate), set(expected))
+        
+class AnalyticsTest(unittest.TestCase):
+    
+    def test_symmetric_graph(self):
+        g = Graph(dict((nid, None) for nid in "ABCDEF"), undirected=True)
+        for src, dst, length in [("A", "B", 1), ("B", "C", 2), ("C", "D", 3), ("B", "E", 4), ("F", "F", 1)]:
+            g.add_edge(src, dst, length)
+        self.assertEqual(analytics.eccentricities(g), {"A": 6, "B": 5, "C": 6, "D": 9, "E": 9, "F": 0})
+        self.assertEqual(analytics.diameter(g), 9)
+        self.assertEqual(analytics.radius(g), (5, ["B"]))
+        self.assertEqual(analytics.diameter(g, samples=2), 9)
+        
+    def test_directed_graph(self):
+        g = Graph(dict((nid, None) for nid in "ABC"))
+        g.add_edge("A", "B", 1)
+        g.add_edge("B", "C", 1)
+        g.add_edge("C", "A", 5)
+        self.assertEqual(analytics.eccentricities(g), {"A": 2, "B": 6, "C": 6})
+        self.assertEqual(analytics.radius(g), (2, ["A"]))
+        self.assertTrue(analytics.diameter(g, samples=1) <= 6)
+        
+class DynamicShortestPathsTest(unittest.TestCase):
+    
+    def assert_matches_dijkstras(self, g, sssp):
+        for src in sssp.origins():
+            for dst in g.node_ids():
+                self.assertEqual(sssp.distance(src, dst), g.path_length(g.dijkstras(src, dst) or [src, None]))
+                path = sssp.path(src, dst)
+                if path != None:
+                    self.assertEqual(g.path_length(path), sssp.distance(src, dst))
+        
+    def test_edge_updates(self):
+        g = Graph(dict((nid, None) for nid in "ABCDE"))
+        g.add_edge("A", "B", 4)
+        g.add_edge("A", "C", 2)
+        g.add_edge("C", "B", 1)
+        g.add_edge("B", "D", 3)
+        sssp = DynamicShortestPaths(g, ["A"])
+        self.assertEqual(sssp.path("A", "D"), ["A", "C", "B", "D"])
+        self.assertEqual(sssp.distance("A", "E"), float("inf"))
+        
+        g.remove_edge("C", "B")
+        self.assertEqual(sssp.path("A", "D"), ["A", "B", "D"])
+        g.add_edge("C", "D", 1)
+        self.assertEqual(sssp.path("A", "D"), ["A", "C", "D"])
+        g.add_edge("A", "C", 10)
+        self.assertEqual(sssp.path("A", "D"), ["A", "B", "D"])
+        g.add_node("F", None)
+        g.add_edge("D", "F", 1)
+        self.assertEqual(sssp.distance("A", "F"), 8)
+        g.remove_node("B")
+        self.assertEqual(sssp.path("A", "F"), ["A", "C", "D", "F"])
+        self.assertIsNone(sssp.path("A", "B"))
+        
+    def test_random_updates(self):
+        rand = random.Random(7)
+        nids = range(15)
+        g = Graph(dict((nid, None) for nid in nids))
+        sssp = DynamicShortestPaths(g, [0, 1, 2])
+        for i in range(300):
+            src, dst = rand.choice(nids), rand.choice(nids)
+            if rand.random() < 0.3:
+                g.remove_edge(src, dst)
+            else:
+                g.add_edge(src, dst, rand.randint(1, 20))
+        self.assert_matches_dijkstras(g, sssp)
+        
+class PartitionOverlayTest(unittest.TestCase):
+    
+    def test_path(self):
+        g = Graph({"A": "x", "B": "x", "C": "x", "D": "y", "E": "y", "F": "y"})
+        for src, dst, length in [("A", "B", 1), ("B", "C", 1), ("C", "D", 5), ("A", "D", 10), ("D", "E", 1), ("E", "F", 1)]:
+            g.add_edge(src, dst, length)
+        invalidated = []
+        overlay = PartitionOverlay(g, lambda nid: g.node(nid).data, invalidated.append)
+        
+        touched = set()
+        self.assertEqual(overlay.path("A", "F", touched), ["A", "B", "C", "D", "E", "F"])
+        self.assertEqual(touched, set(["x", "y"]))
+        self.assertEqual(overlay.borders("x"), set(["A", "C"]))
+        self.assertIsNone(overlay.path("F", "A"))
+        
+        # an edit within a partition only invalidates that partition
+        g.add_edge("B", "C", 10)
+        self.assertEqual(invalidated, ["x"])
+        self.assertEqual(overlay.path("A", "F"), ["A", "D", "E", "F"])
+        g.remove_edge("A", "D")
+        self.assertEqual(overlay.borders("x"), set(["C"]))
+        self.assertEqual(overlay.path("A", "F"), ["A", "B", "C", "D", "E", "F"])
+        
+        # a node moved to another partition changes the borders
+        g.set_node_data("D", "x")
+        self.assertEqual(overlay.borders("y"), set(["E"]))
+        self.assertEqual(overlay.path("A", "F"), ["A", "B", "C", "D", "E", "F"])
+        
+    def test_random_updates(self):
+        rand = random.Random(11)
+        nids = range(20)
+        g = Graph(dict((nid, nid % 3) for nid in nids))
+        overlay = PartitionOverlay(g, lambda nid: g.node(nid).data)
+        for i in range(300):
+            src, dst = rand.choice(nids), rand.choice(nids)
+            if rand.random() < 0.05:
+                g.set_node_data(src, rand.randint(0, 2))
+            elif rand.random() < 0.3:
+                g.remove_edge(src, dst)
+            else:
+                g.add_edge(src, dst, rand.randint(1, 20))
+            
+            src, dst = rand.choice(nids), rand.choice(nids)
+            dists = g.distances_from(src)[0]
+            path = overlay.path(src, dst)
+            if dst in dists:
+                self.assertEqual(g.path_length(path), dists[dst])
+            else:
+                self.assertIsNone(path)
+                
+    def test_build(self):
+        rand = random.Random(5)
+        nids = range(20)
+        g = Graph(dict((nid, nid % 3) for nid in nids))
+        for i in range(60):
+            g.add_edge(rand.choice(nids), rand.choice(nids), rand.randint(1, 20))
+        built = PartitionOverlay(g, lambda nid: g.node(nid).data)
+        lazy = PartitionOverlay(g, lambda nid: g.node(nid).data)
+        
+        for edit in range(2):
+            built.build()
+            for part in range(3):
+                self.assertEqual(set(built._shortcuts.get(part, dict())), built.borders(part))
+                for border in built.borders(part):
+                    self.assertEqual(built._shortcuts[part][border], lazy._shortcut(part, border))
+            for src, dst in [(rand.choice(nids), rand.choice(nids)) for i in range(20)]:
+                self.assertEqual(built.path(src, dst), lazy.path(src, dst))
+            
+            # an edit drops the edited partition's shortcuts until the next build
+            g.add_edge(0, 3, 30 + edit)
+            self.assertEqual(built._shortcuts.get(0), None)
+        
+class RouteSearchTest(unittest.TestCase):
+    
+    RATES = [0.35, 0.30, 0.25, 0.20, 0.15, 0.10, 0.05]
+    
+    def flight_time(self, distance):
+        return distance / 750.0 + 0.5
+    
+    def layover_time(self, node):
+        return 1.0
+    
+    def simple_paths(self, g, src, dst, path=None):
+        path = path or [src]
+        if path[-1] == dst:
+            return [list(path)]
+        paths = []
+        for child in g.child_ids(path[-1]):
+            if child not in path:
+                paths.extend(self.simple_paths(g, src, dst, path + [child]))
+        return paths
+    
+    def cost(self, g, path):
+        return sum([self.RATES[i] * g.edge(path[i], path[i + 1]) for i in range(min(len(path) - 1, len(self.RATES)))])
+    
+    def time(self, g, path):
+        return sum([self.flight_time(g.edge(path[i], path[i + 1])) for i in range(len(path) - 1)]) + \
+            sum([self.layover_time(node) for node in path[1:-1]])
+    
+    def test_cheapest_path_revisits(self):
+        # the label 0-2-4 is cheaper than 0-4 at 4, but cannot go on through 2
+        g = Graph(dict((nid, None) for nid in range(6)), undirected=True)
+        for src, dst, length in [(0, 2, 23), (0, 4, 47), (1, 2, 383), (1, 4, 15), (2, 4, 21), (2, 5, 786), (4, 5, 1256)]:
+            g.add_edge(src, dst, length)
+        path, cost = route_search.cheapest_path(g, 0, 5, self.RATES)
+        self.assertEqual(path, [0, 4, 2, 5])
+        self.assertAlmostEqual(cost, 219.25)
+        
+    def test_random_graphs(self):
+        rand = random.Random(5)
+        for i in range(300):
+            size = rand.randint(3, 7)
+            g = Graph(dict((nid, None) for nid in range(size)), undirected=rand.random() < 0.5)
+            for j in range(rand.randint(size, 3 * size)):
+                src, dst = rand.sample(range(size), 2)
+                g.add_edge(src, dst, rand.randint(1, 1500))
+            
+            paths = self.simple_paths(g, 0, size - 1)
+            cheapest = route_search.cheapest_path(g, 0, size - 1, self.RATES)
+            options = route_search.pareto_paths(g, 0, size - 1, self.flight_time, self.layover_time, self.RATES)
+            if len(paths) == 0:
+                self.assertIsNone(cheapest)
+                self.assertEqual(options, [])
+                continue
+            
+            self.assertAlmostEqual(cheapest[1], min([self.cost(g, path) for path in paths]))
+            # every route not beaten on time, cost and flights is an option
+            points = [(round(self.time(g, path), 6), round(self.cost(g, path), 6), len(path) - 1) for path in paths]
+            best = set([point for point in points if not any([other != point and
+                                                              all([a <= b for a, b in zip(other, point)])
+                                                              for other in points])])
+            found = set([(round(time, 6), round(cost, 6), len(path) - 1) for path, time, cost in options])
+            self.assertTrue(best <= found)
+        
 class ParserTest(unittest.TestCase):
         
         def test_load_data(self):
@@ -112,6 +459,76 @@ class ParserTest(unittest.TestCase):
             self.assertEqual(g.node("MEX").data["name"], "Mexico City")
             self.assertEqual(g.node("SCL").data["name"], "Santiago")
             
+        def test_load_lazy(self):
+            g, fields = graph_parser.load_lazy("../data/map_data.json")
+            eager = graph_parser.load("../data/map_data.json")
+            self.assertEqual(g.edges, eager.edges)
+            self.assertEqual(len(fields["data sources"]), 6)
+            
+            # metros are parsed on first access
+            self.assertFalse(any([node.is_loaded() for node in g.nodes]))
+            self.assertEqual(g.node("CHI").data, eager.node("CHI").data)
+            self.assertTrue(g.node("CHI").is_loaded())
+            self.assertEqual(len([node for node in g.nodes if node.is_loaded()]), 1)
+            
+        def test_load_lazy_nested_keys(self):
+            directory = tempfile.mkdtemp()
+            try:
+                filename = os.path.join(directory, "nested.json")
+                with open(filename, "w") as data:
+                    data.write('{"metros": [{"info": {"code": "ZZZ", "continent": "Asia"}, "tags": ["code"],'
+                               ' "code": "AAA", "continent": "Europe"}], "routes": []}')
+                g, fields = graph_parser.load_lazy(filename)
+                self.assertEqual(g.node_ids(), ["AAA"])
+                self.assertEqual(g.node("AAA").field("continent"), "Europe")
+                self.assertFalse(g.node("AAA").is_loaded())
+                self.assertEqual(g.node("AAA").data["info"]["code"], "ZZZ")
+            finally:
+                shutil.rmtree(directory)
+            
+        def test_load_many(self):
+            g = graph_parser.load("../data/test_data.json")
+            conflicts = graph_parser.load_many(g, ["../data/test_data.json", "../data/cmi_hub.json"], processes=2)
+            self.assertIn("CMI", g)
+            self.assertEqual(g.distance_between("MEX", "CMI"), 2518)
+            self.assertEqual(g.distance_between("CMI", "MEX"), 2518)
+            self.assertEqual(len(conflicts), 8)
+            self.assertEqual(conflicts[0], "../data/cmi_hub.json: route CMI-LAX has an unknown metro, skipped")
+            
+        def test_load_undirected(self):
+            g = graph_parser.load("../data/test_data.json", undirected=True)
+            self.assertTrue(g.undirected)
+            self.assertEqual(set(g.child_ids("LIM")), set(["SCL", "MEX"]))
+            self.assertEqual(g.distance_between("MEX", "LIM"), 4231)
+            self.assertEqual(len([dist for row in g.edges.values() for dist in row.values() if dist != None]), 2)
+            
+        def test_load_undirected_if_symmetric(self):
+            self.assertTrue(graph_parser.load("../data/test_data.json", undirected=None).undirected)
+            
+            directory = tempfile.mkdtemp()
+            try:
+                filename = os.path.join(directory, "one_way.json")
+                with open("../data/test_data.json") as data:
+                    map_data = json.load(data)
+                map_data["routes"].append({"ports": ["LIM", "SCL"], "distance": 2000})
+                with open(filename, "w") as data:
+                    json.dump(map_data, data)
+                
+                # routes are only merged if every route has an equal one back
+                g = graph_parser.load(filename, symmetric_routes=False, undirected=None)
+                self.assertFalse(g.undirected)
+                self.assertEqual(g.edge("SCL", "LIM"), 2453)
+                self.assertEqual(g.edge("LIM", "SCL"), 2000)
+                
+                # one-way routes loaded into an undirected graph make it directed
+                g = graph_parser.load("../data/test_data.json", undirected=True)
+                graph_parser.load_extra(g, filename, symmetric_routes=False)
+                self.assertFalse(g.undirected)
+                self.assertEqual(g.edge("SCL", "LIM"), 2453)
+                self.assertEqual(g.edge("LIM", "SCL"), 2000)
+            finally:
+                shutil.rmtree(directory)
+            
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file